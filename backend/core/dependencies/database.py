@@ -4,10 +4,15 @@ from fastapi import Depends
 from sqlalchemy.orm import Session
 
 from backend.database.session_manager import sessionmanager
+from backend.database.utils import current_request_connection
 
 
 def get_db_session() -> t.Generator[Session, t.Any, None]:
-    with sessionmanager.session() as session:
+    # within a request the session joins the transaction `db.*` calls run in
+    scope = current_request_connection()
+    bind = scope.get_bind() if scope is not None else None
+
+    with sessionmanager.session(bind=bind) as session:
         yield session
 
 
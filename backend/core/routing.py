@@ -0,0 +1,21 @@
+from fastapi.routing import APIRoute
+
+from backend.database.utils import async_request_connection
+
+
+class RequestConnectionRoute(APIRoute):
+    """
+    Every `db.*` call and the `get_db_session` session of a request share one
+    pooled connection. It is checked out on first use and goes back to the pool
+    as soon as the endpoint returns, before the response is sent and background
+    tasks run. Only for routers that touch the database.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request):
+            async with async_request_connection():
+                return await handler(request)
+
+        return route_handler
@@ -31,6 +31,7 @@ CORS_SETTINGS: dict[str, t.Any] = {
 MOHIRAI_API_KEY: str = config("MOHIRAI_API_KEY")
 PBX_API_URL = "https://api.onlinepbx.ru/{domain}"
 MOHIRAI_API_URL: str = "https://uzbekvoice.ai/api/v1/stt"
+DEPLOYMENT_NAME: str = config("DEPLOYMENT_NAME", default="gpt4")
 
 
 ###
@@ -38,6 +39,11 @@ MOHIRAI_API_URL: str = "https://uzbekvoice.ai/api/v1/stt"
 ###
 DATABASE_URL: str = config("DATABASE_URL")
 ECHO_SQL: bool = config("ECHO_SQL", cast=bool, default=False)
+# one pool per process, shared by ORM sessions and raw SQL of `backend.db`
+DB_POOL_SIZE: int = config("DB_POOL_SIZE", cast=int, default=10)
+DB_MAX_OVERFLOW: int = config("DB_MAX_OVERFLOW", cast=int, default=20)
+# seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT: float = config("DB_POOL_TIMEOUT", cast=float, default=30.0)
 
 ###
 # Auth
@@ -52,6 +58,15 @@ MOHIRAI_PRICE_PER_MS: float = 630 / 60 / 1000 * 100
 GENERAL_PROMPT_PRICE_PER_MS: float = 210 / 60 / 1000 * 100
 CHECKLIST_PROMPT_PRICE_PER_MS: float = 360 / 60 / 1000 * 100
 
+# records handed to the broker between two progress events of a bulk reprocess
+BULK_REPROCESS_BATCH_SIZE: int = config(
+    "BULK_REPROCESS_BATCH_SIZE", cast=int, default=100
+)
+# seconds a reprocessed record may stay PENDING before its reservation is dropped
+BULK_REPROCESS_RESERVATION_TTL: int = config(
+    "BULK_REPROCESS_RESERVATION_TTL", cast=int, default=6 * 60 * 60
+)
+
 # slowing down startup process.
 # currently, I may not need this module
 ANTI_SLOW_DOWN: bool = config("ANTI_SLOW_DOWN", cast=bool, default=False)
@@ -13,8 +13,9 @@ class DatabaseSessionManager:
     def __init__(self, host: str, engine_kwargs: dict[str, t.Any] = {}):
         # Optimized connection pooling
         optimized_kwargs = {
-            "pool_size": 10,  # Connection pool size
-            "max_overflow": 20,  # Max connections beyond pool_size
+            "pool_size": settings.DB_POOL_SIZE,  # Connection pool size
+            "max_overflow": settings.DB_MAX_OVERFLOW,  # Beyond pool_size
+            "pool_timeout": settings.DB_POOL_TIMEOUT,  # Wait for a free connection
             "pool_pre_ping": True,  # Verify connections before use
             "pool_recycle": 3600,  # Recycle connections after 1 hour
             "echo": engine_kwargs.get("echo", False),
@@ -50,11 +51,18 @@ class DatabaseSessionManager:
                 raise
 
     @contextlib.contextmanager
-    def session(self) -> t.Iterator[Session]:
+    def session(self, bind: t.Optional[Connection] = None) -> t.Iterator[Session]:
         if self._sessionmaker is None:
             raise Exception("DB session manager is not initialized")
 
-        session = self._sessionmaker()
+        if bind is None:
+            session = self._sessionmaker()
+        else:
+            # e.g. the current request's connection: the session runs in a
+            # savepoint of the connection's transaction and never ends it
+            session = self._sessionmaker(
+                bind=bind, join_transaction_mode="create_savepoint"
+            )
 
         try:
             yield session
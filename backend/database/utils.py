@@ -1,65 +1,187 @@
+import asyncio
 import logging
 import datetime
-
-from decouple import config
+import threading
+import contextlib
+import contextvars
+import typing as t
 
 import psycopg2
 import psycopg2.extras
-from psycopg2.pool import SimpleConnectionPool
 from psycopg2.extensions import connection as Connection
 
+from sqlalchemy.orm import Session
 from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Connection as SAConnection, Transaction as SATransaction
 from sqlalchemy.sql.selectable import Select
 
-pool: SimpleConnectionPool | None = None
-
-
-def get_pool() -> SimpleConnectionPool:
-    global pool
-
-    if pool is None:
-        pool = SimpleConnectionPool(
-            minconn=1,
-            maxconn=10,
-            dsn=config("DATABASE_URL"),
-        )
-
-    return pool
+from backend.database.session_manager import sessionmanager
+
+
+def raw_connection():
+    """
+    psycopg2 connection checked out of the SQLAlchemy engine pool, raw SQL and
+    ORM sessions share one pool. `close()` returns it to the pool.
+    """
+    return sessionmanager._engine.raw_connection()
+
+
+def get_driver_connection(bind: t.Union[Session, SAConnection]) -> Connection:
+    """psycopg2 connection a session or SQLAlchemy connection runs on"""
+    if isinstance(bind, Session):
+        bind = bind.connection()
+    return bind.connection.driver_connection
+
+
+def pool_metrics() -> dict:
+    engine_pool = sessionmanager._engine.pool
+    return {
+        "size": engine_pool.size(),
+        "checked_in": engine_pool.checkedin(),
+        "checked_out": engine_pool.checkedout(),
+        "overflow": engine_pool.overflow(),
+        "timeout": engine_pool.timeout(),
+    }
+
+
+class RequestConnection:
+    """
+    Connection shared by every `db.*` call and the ORM session of one request,
+    opened lazily. Its transaction spans the request: `db.*` calls run in
+    savepoints of it, the session joins it through its own savepoint, and it
+    is committed on release unless the request failed.
+    """
+
+    def __init__(self):
+        self.bind: SAConnection | None = None
+        self.transaction: SATransaction | None = None
+        self.lock = threading.Lock()
+
+    def get_bind(self) -> SAConnection:
+        with self.lock:
+            if self.bind is None:
+                self.bind = sessionmanager._engine.connect()
+                self.transaction = self.bind.begin()
+            return self.bind
+
+    def get(self) -> Connection:
+        return get_driver_connection(self.get_bind())
+
+    def release(self, commit: bool = False) -> None:
+        if self.bind is None:
+            return
+
+        try:
+            if commit and self.transaction.is_active:
+                self.transaction.commit()
+        finally:
+            # rolls back whatever is not committed
+            self.bind.close()
+            self.bind = self.transaction = None
+
+
+_request_connection: contextvars.ContextVar[RequestConnection | None] = (
+    contextvars.ContextVar("request_connection", default=None)
+)
+
+
+def current_request_connection() -> RequestConnection | None:
+    return _request_connection.get()
+
+
+@contextlib.contextmanager
+def request_connection() -> t.Iterator[RequestConnection]:
+    """`db.*` calls made within share one connection and transaction"""
+    scope = RequestConnection()
+    token = _request_connection.set(scope)
+    succeeded = False
+    try:
+        yield scope
+        succeeded = True
+    finally:
+        _request_connection.reset(token)
+        scope.release(commit=succeeded)
+
+
+@contextlib.asynccontextmanager
+async def async_request_connection() -> t.AsyncIterator[RequestConnection]:
+    """
+    `request_connection` for the event loop, the transaction is finished and the
+    connection returned to the pool in a worker thread.
+    """
+    scope = RequestConnection()
+    token = _request_connection.set(scope)
+    succeeded = False
+    try:
+        yield scope
+        succeeded = True
+    finally:
+        _request_connection.reset(token)
+        if scope.bind is not None:
+            await asyncio.to_thread(scope.release, succeeded)
 
 
 class ConnectionWrapper:
+    """
+    Pooled connection of one `db.*` call, committed (rolled back on error) on
+    exit. Within a request the call is a savepoint of the request's transaction
+    instead, so the session sharing the connection is never committed under it.
+    """
+
     def __enter__(self):
-        self.pool = get_pool()
-        self.current_connection = self.pool.getconn()
+        scope = current_request_connection()
+        self.savepoint = None
+
+        if scope is not None:
+            self.savepoint = scope.get_bind().begin_nested()
+            self.current_connection = scope.get()
+        else:
+            self.current_connection = raw_connection()
         return self.current_connection
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.pool.putconn(self.current_connection)
+        if self.savepoint is not None:
+            if exc_type is None:
+                self.savepoint.commit()
+            else:
+                self.savepoint.rollback()
+            return
+
+        try:
+            if exc_type is None:
+                self.current_connection.commit()
+            else:
+                self.current_connection.rollback()
+        finally:
+            self.current_connection.close()
 
 
 def db_connection_wrapper(func):
-    def wrapper(*args, **kwargs):
-        start_time = datetime.datetime.now()
+    """
+    Runs `func` on a pooled connection and commits (rolls back on error) after it.
+    Given `session=` or `connection=` (SQLAlchemy), `func` runs inside that
+    transaction instead and committing it is up to the caller.
+    """
+
+    def wrapper(
+        *args,
+        session: t.Optional[Session] = None,
+        connection: t.Optional[SAConnection] = None,
+        **kwargs,
+    ):
+        if session is not None or connection is not None:
+            return func(get_driver_connection(session or connection), *args, **kwargs)
 
-        with ConnectionWrapper() as connection:
-            exception = None
+        start_time = datetime.datetime.now()
 
-            try:
+        try:
+            with ConnectionWrapper() as connection:
                 return func(connection, *args, **kwargs)
-            except Exception as exc:
-                exception = exc
-                raise exc
-            finally:
-                if datetime.datetime.now() - start_time > datetime.timedelta(
-                    seconds=0.5
-                ):
-                    logging.warning(
-                        f"Slow query: {func.__name__} took {datetime.datetime.now() - start_time}"
-                    )
-                if exception:
-                    connection.rollback()
-                else:
-                    connection.commit()
+        finally:
+            if datetime.datetime.now() - start_time > datetime.timedelta(seconds=0.5):
+                logging.warning(
+                    f"Slow query: {func.__name__} took {datetime.datetime.now() - start_time}"
+                )
 
     wrapper.__name__ = func.__name__
     return wrapper
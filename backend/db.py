@@ -12,13 +12,19 @@ import typing as t
 
 import psycopg2
 import psycopg2.extras
-from psycopg2.extensions import register_adapter, connection as Connection
+from psycopg2.extensions import connection as Connection
 
 from backend.services.result import get_results_by_record_id_sa
-from backend.services.record import get_records_sa, get_records_with_results
+from backend.services.record import (
+    get_records_sa,
+    get_records_with_results,
+    get_record_ids_with_results,
+)
 from backend.database.utils import db_connection_wrapper, select_many, select_one
 
-register_adapter(uuid.UUID, lambda _uuid: psycopg2.extensions.AsIs(str(uuid)))
+# UUID parameters are sent as uuid literals, columns come back as UUID, the
+# same the SQLAlchemy dialect sets up on every connection of the engine pool
+psycopg2.extras.register_uuid()
 
 
 @db_connection_wrapper
@@ -38,6 +44,110 @@ def get_balance(connection: Connection, owner_id: str):
         return dict(cursor.fetchone())
 
 
+@db_connection_wrapper
+def reserve_records_for_reprocess(
+    connection: Connection,
+    owner_id: str,
+    record_ids: t.Optional[list[uuid.UUID]] = None,
+    record_filter_params: t.Optional[dict] = None,
+    result_filter_params: t.Optional[dict] = None,
+    general: bool = False,
+    checklist: bool = False,
+    prices: t.Optional[dict] = None,
+    reservation_ttl: int = 6 * 60 * 60,
+) -> dict:
+    """
+    Prices every matching record in one aggregate and, if the balance covers it,
+    marks them all PENDING in the same transaction. Calls of the same owner are
+    serialized by an advisory lock, records already PENDING are skipped and
+    their worst case price is held back from the balance until they finish.
+    Records PENDING for longer than `reservation_ttl` seconds count as lost,
+    they hold nothing back and can be reprocessed again.
+    """
+    prices = prices or {}
+    ids_query, query_params = get_record_ids_with_results(
+        owner_id,
+        record_ids=record_ids,
+        **(record_filter_params or {}),
+        **(result_filter_params or {}),
+    )
+    query_params = {
+        **query_params,
+        "bulk_owner_id": owner_id,
+        "bulk_reservation_ttl": reservation_ttl,
+        "bulk_stt_price": prices.get("stt", 0),
+        "bulk_general_price": prices.get("general", 0) if general else 0,
+        "bulk_checklist_price": prices.get("checklist", 0) if checklist else 0,
+        "bulk_max_prompt_price": (
+            prices.get("general", 0) + prices.get("checklist", 0)
+        ),
+    }
+
+    with connection.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+        # held until commit/rollback of this transaction
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(hashtext(%(bulk_owner_id)s))", query_params
+        )
+        reserved = """
+            status = 'PENDING'
+            AND updated_at > NOW() - make_interval(secs => %(bulk_reservation_ttl)s)
+        """
+        cursor.execute(
+            f"""
+            WITH selected AS (
+                SELECT * FROM record
+                WHERE id IN ({ids_query}) AND NOT COALESCE({reserved}, FALSE)
+            ),
+            pending AS (
+                SELECT * FROM record
+                WHERE owner_id = %(bulk_owner_id)s AND {reserved}
+            )
+            SELECT
+                (SELECT COUNT(*) FROM selected) AS count,
+                (
+                    SELECT COALESCE(SUM(
+                        duration * (
+                            CASE WHEN payload IS NULL
+                            THEN %(bulk_stt_price)s ELSE 0 END
+                            + %(bulk_general_price)s + %(bulk_checklist_price)s
+                        )
+                    ), 0) FROM selected
+                ) AS cost,
+                (
+                    SELECT COALESCE(SUM(
+                        duration * (
+                            CASE WHEN payload IS NULL
+                            THEN %(bulk_stt_price)s ELSE 0 END
+                            + %(bulk_max_prompt_price)s
+                        )
+                    ), 0) FROM pending
+                ) AS reserved,
+                (
+                    SELECT COALESCE(SUM(amount), 0) FROM transaction
+                    WHERE owner_id = %(bulk_owner_id)s
+                ) AS balance
+            """,
+            query_params,
+        )
+        summary = dict(cursor.fetchone())
+        summary["record_ids"] = []
+
+        available = summary["balance"] - summary["reserved"]
+        if summary["count"] == 0 or summary["cost"] > available:
+            return summary
+
+        cursor.execute(
+            f"""
+            UPDATE record SET status = 'PENDING', updated_at = NOW()
+            WHERE id IN ({ids_query}) AND NOT COALESCE({reserved}, FALSE)
+            RETURNING id
+            """,
+            query_params,
+        )
+        summary["record_ids"] = [str(record["id"]) for record in cursor.fetchall()]
+        return summary
+
+
 RECORD_JSON_FIELDS: tuple[str] = ("payload", "bitrix_result")
 
 
@@ -227,6 +337,84 @@ def upsert_result(connection: Connection, result: dict):
         return dict(cursor.fetchone())
 
 
+@db_connection_wrapper
+def get_records_and_results_by_ids(
+    connection: Connection, record_ids: list[str]
+) -> tuple[dict, dict]:
+    """Records by id and their results by record id, two queries for any count"""
+    records = select_many(
+        connection, "SELECT * FROM record WHERE id = ANY(%s::uuid[])", (record_ids,)
+    )
+    results = select_many(
+        connection,
+        "SELECT * FROM result WHERE record_id = ANY(%s::uuid[])",
+        (record_ids,),
+    )
+    return (
+        {str(record["id"]): record for record in records},
+        {str(result["record_id"]): result for result in results},
+    )
+
+
+@db_connection_wrapper
+def upsert_results_batch(
+    connection: Connection,
+    completed_records: list[tuple],
+    failed_record_ids: list[str],
+    results: list[dict],
+):
+    """
+    Persists a micro-batch of finished tasks in one transaction:
+      - `completed_records` (record id, bitrix_result JSON) become COMPLETED
+      - `failed_record_ids` become FAILED
+      - `results` are upserted with a single multi-row INSERT ... ON CONFLICT,
+        every result must have the same keys
+    """
+    with connection.cursor() as cursor:
+        if completed_records:
+            psycopg2.extras.execute_values(
+                cursor,
+                """
+                UPDATE record SET
+                status = 'COMPLETED',
+                bitrix_result = batch.bitrix_result::json,
+                updated_at = NOW()
+                FROM (VALUES %s) AS batch (id, bitrix_result)
+                WHERE record.id = batch.id::uuid
+                """,
+                completed_records,
+            )
+
+        if failed_record_ids:
+            cursor.execute(
+                "UPDATE record SET status = 'FAILED', updated_at = NOW() "
+                "WHERE id = ANY(%s::uuid[])",
+                (failed_record_ids,),
+            )
+
+        if not results:
+            return
+
+        keys = [key for key in results[0] if key not in ["created_at", "updated_at"]]
+        psycopg2.extras.execute_values(
+            cursor,
+            f"INSERT INTO result ({', '.join(keys)}) VALUES %s "
+            f"ON CONFLICT (id) DO UPDATE SET "
+            f"{', '.join(f'{key} = EXCLUDED.{key}' for key in keys if key != 'id')}, "
+            "updated_at = NOW()",
+            [
+                tuple(
+                    psycopg2.extras.Json(result[key])
+                    if isinstance(result[key], dict)
+                    else result[key]
+                    for key in keys
+                )
+                for result in results
+            ],
+            page_size=len(results),
+        )
+
+
 @db_connection_wrapper
 def get_result_by_record_id_v1(connection, record_id: str, owner_id: str):
     # without filter
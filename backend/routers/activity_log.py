@@ -16,8 +16,11 @@ from backend.services import activity_log
 from backend.core.dependencies.user import get_current_user, CurrentUser
 from backend.core.dependencies.database import DatabaseSessionDependency
 from backend.utils.shortcuts import model_to_dict, models_to_dict
+from backend.core.routing import RequestConnectionRoute
 
-activity_log_router = APIRouter(tags=["Activity Logs"])
+activity_log_router = APIRouter(
+    tags=["Activity Logs"], route_class=RequestConnectionRoute
+)
 
 
 @activity_log_router.get("/activity-logs")
@@ -16,8 +16,9 @@ from backend.core.dependencies.user import get_current_user, CurrentUser
 from backend.core.dependencies.database import DatabaseSessionDependency
 from backend.utils.shortcuts import model_to_dict
 from backend.schemas import AIChatMessage as AIChatMessageSchema
+from backend.core.routing import RequestConnectionRoute
 
-ai_chat_router = APIRouter(tags=["AI Chat"])
+ai_chat_router = APIRouter(tags=["AI Chat"], route_class=RequestConnectionRoute)
 MAX_QUESTIONS_PER_SESSION = 10
 
 
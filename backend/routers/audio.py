@@ -8,12 +8,21 @@ import httpx
 from celery.result import AsyncResult
 
 from fastapi.responses import JSONResponse
-from fastapi import Depends, UploadFile, Request, APIRouter, status, HTTPException
+from fastapi import (
+    Depends,
+    UploadFile,
+    Request,
+    APIRouter,
+    BackgroundTasks,
+    status,
+    HTTPException,
+)
 
 from backend import db
 from backend.schemas import (
     User,
     ReprocessRecord,
+    BulkReprocessRecords,
     RecordQueryParams,
     ResultQueryParams,
     PBXCallHistoryRequest,
@@ -21,9 +30,8 @@ from backend.schemas import (
     ResultOrderQueries,
 )
 from backend.core import settings
-from workers.data import upsert_data
 from utils.encoder import adapt_json
-from workers.api import api_processing
+from workers.pipeline import enqueue_processing
 from utils.storage import get_stream_url
 from backend.utils.pbx import filter_calls
 from backend.services.record import (
@@ -38,11 +46,14 @@ from backend.utils.analyze import (
     estimate_costs_from_pbx,
     estimate_costs_from_upload,
 )
+from backend.tasks.reprocess import bulk_reprocess_task
+from backend.services.checklist import get_single_checklist
 from backend.core.dependencies.database import DatabaseSessionDependency
 from backend.core.dependencies.audio_processing import process_form_data
+from backend.core.routing import RequestConnectionRoute
 
 
-audio_router = APIRouter(tags=["Audios"])
+audio_router = APIRouter(tags=["Audios"], route_class=RequestConnectionRoute)
 
 
 def generate_task_id(user_id: uuid.UUID) -> str:
@@ -60,7 +71,7 @@ def get_filterable_values(
 
 
 @audio_router.get("/audios_results")
-async def get_audio_results(
+def get_audio_results(
     db_session: DatabaseSessionDependency,
     current_user: User = Depends(get_current_user),
     record_query_params: RecordQueryParams = Depends(),
@@ -177,7 +188,7 @@ def estimate_cost_before_process_from_pbx(
 
 
 @audio_router.post("/reprocess")
-async def reprocess_data(
+def reprocess_data(
     record: ReprocessRecord, current_user: User = Depends(get_current_user)
 ):
     record_id = record.record_id
@@ -219,36 +230,20 @@ async def reprocess_data(
 
     task_id = generate_task_id(user_id=current_user.id)
 
-    task: AsyncResult = api_processing.apply_async(
-        kwargs={
-            "task": {
-                "audio_record": record,
-                "checklist_id": checklist_id,
-                "general": general,
-                "folder_name": folder_name,
-            },
+    task: AsyncResult = enqueue_processing(
+        task={
+            "audio_record": record,
+            "checklist_id": checklist_id,
+            "general": general,
+            "folder_name": folder_name,
+        },
+        callback={
+            "task_id": task_id,
+            "owner_id": str(current_user.id),
+            "record_id": record_id,
+            "checklist_id": checklist_id,
+            "storage_id": record["storage_id"],
         },
-        link=upsert_data.s(
-            task={
-                "task_id": task_id,
-                "owner_id": str(current_user.id),
-                "record_id": record_id,
-                "checklist_id": checklist_id,
-                "storage_id": record["storage_id"],
-                "is_success": True,
-            }
-        ).set(queue="data"),
-        link_error=upsert_data.s(
-            task={
-                "task_id": task_id,
-                "owner_id": str(current_user.id),
-                "record_id": record_id,
-                "checklist_id": checklist_id,
-                "storage_id": record["storage_id"],
-                "is_success": False,
-            }
-        ).set(queue="data"),
-        queue="api",
         task_id=task_id,
     )
 
@@ -260,8 +255,80 @@ async def reprocess_data(
     return JSONResponse(status_code=200, content=response_data)
 
 
+@audio_router.post("/reprocess/bulk")
+def bulk_reprocess_data(
+    data: BulkReprocessRecords,
+    background_tasks: BackgroundTasks,
+    db_session: DatabaseSessionDependency,
+    current_user: User = Depends(get_current_user),
+):
+    owner_id = str(current_user.id)
+    checklist_id = str(data.checklist_id) if data.checklist_id else None
+    folder_name = current_user.company_name.lower().replace(" ", "_")
+    record_filter_params = data.record_filters.model_dump(
+        mode="python", exclude_none=True
+    )
+    result_filter_params = data.result_filters.model_dump(
+        mode="python", exclude_none=True
+    )
+
+    if not (data.record_ids or record_filter_params or result_filter_params):
+        return JSONResponse(
+            status_code=400, content={"error": "Either record_ids or filters required"}
+        )
+
+    if checklist_id and not get_single_checklist(
+        db_session=db_session, owner_id=current_user.id, checklist_id=checklist_id
+    ):
+        return JSONResponse(status_code=404, content={"error": "Checklist not found"})
+
+    # priced, checked against the balance and marked PENDING atomically
+    summary = db.reserve_records_for_reprocess(
+        owner_id=owner_id,
+        record_ids=data.record_ids,
+        record_filter_params=record_filter_params,
+        result_filter_params=result_filter_params,
+        general=data.general,
+        checklist=checklist_id is not None,
+        prices={
+            "stt": settings.MOHIRAI_PRICE_PER_MS,
+            "general": settings.GENERAL_PROMPT_PRICE_PER_MS,
+            "checklist": settings.CHECKLIST_PROMPT_PRICE_PER_MS,
+        },
+        reservation_ttl=settings.BULK_REPROCESS_RESERVATION_TTL,
+    )
+
+    if summary["count"] == 0:
+        return JSONResponse(status_code=404, content={"error": "Records not found"})
+
+    if not summary["record_ids"]:
+        return JSONResponse(status_code=400, content={"error": "Not enough balance"})
+
+    bulk_id = generate_task_id(user_id=current_user.id)
+    # published after the response, once the request's transaction has
+    # committed the reservation the task reads back
+    background_tasks.add_task(
+        bulk_reprocess_task.delay,
+        bulk_id=bulk_id,
+        record_ids=summary["record_ids"],
+        owner_id=owner_id,
+        checklist_id=checklist_id,
+        general=data.general,
+        folder_name=folder_name,
+    )
+
+    response_data = {
+        "id": bulk_id,
+        "count": summary["count"],
+        "cost": float(summary["cost"]),
+        "status": "PENDING",
+    }
+
+    return JSONResponse(status_code=200, content=response_data)
+
+
 @audio_router.get("/audios/pending")
-async def get_pending_audios(current_user: User = Depends(get_current_user)):
+def get_pending_audios(current_user: User = Depends(get_current_user)):
     data = db.get_pending_audios(owner_id=str(current_user.id))
     data = adapt_json(data)
     return JSONResponse(status_code=200, content=data)
@@ -12,8 +12,9 @@ from backend.core.dependencies.user import get_current_user
 from backend.core.dependencies.database import DatabaseSessionDependency
 from backend.schemas import User, CheckList, CheckListUpdate, CheckListCreate
 from backend.utils.shortcuts import model_to_dict, models_to_dict, raise_404
+from backend.core.routing import RequestConnectionRoute
 
-checklist_router = APIRouter(tags=["Checklist"])
+checklist_router = APIRouter(tags=["Checklist"], route_class=RequestConnectionRoute)
 
 
 @checklist_router.get("/checklists")
@@ -21,9 +21,12 @@ from backend.services import company as company_service
 from backend.core.dependencies.user import get_current_user, CurrentUser
 from backend.core.dependencies.database import DatabaseSessionDependency
 from backend.utils.shortcuts import model_to_dict
+from backend.core.routing import RequestConnectionRoute
 
 
-company_router = APIRouter(tags=["Company Management"])
+company_router = APIRouter(
+    tags=["Company Management"], route_class=RequestConnectionRoute
+)
 
 
 def check_admin_access(current_user: CurrentUser):
@@ -10,12 +10,13 @@ from utils.encoder import adapt_json
 from backend.services import dashboard as dashboard_service
 from backend.core.dependencies.user import get_current_user
 from backend.core.dependencies.database import DatabaseSessionDependency
+from backend.core.routing import RequestConnectionRoute
 
-dashboard_router = APIRouter(tags=["Dashboard"])
+dashboard_router = APIRouter(tags=["Dashboard"], route_class=RequestConnectionRoute)
 
 
 @dashboard_router.get("/dashboard")
-async def list_dashboard(
+def list_dashboard(
     db_session: DatabaseSessionDependency,
     start: datetime,
     end: datetime,
@@ -7,6 +7,9 @@ from fastapi import APIRouter, Depends, status
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 
+from utils import rate_limit
+from backend.core import settings
+from backend.database.utils import pool_metrics
 from backend.core.monitoring import HealthChecker, MetricsCollector, structured_logger
 from backend.database.session_manager import sessionmanager
 
@@ -16,7 +19,7 @@ health_router = APIRouter(tags=["Health & Monitoring"])
 
 
 @health_router.get("/health")
-async def healthcheck():
+def healthcheck():
     """Basic health check"""
     structured_logger.info("health_check_requested")
 
@@ -74,6 +77,21 @@ async def get_metrics():
     )
 
 
+@health_router.get("/metrics/rate-limits")
+async def get_rate_limit_metrics():
+    """Remaining capacity of the shared provider rate limiters"""
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=rate_limit.metrics([settings.DEPLOYMENT_NAME]),
+    )
+
+
+@health_router.get("/metrics/db-pool")
+async def get_db_pool_metrics():
+    """Usage of the connection pool shared by ORM sessions and raw SQL"""
+    return JSONResponse(status_code=status.HTTP_200_OK, content=pool_metrics())
+
+
 @health_router.post("/metrics/reset")
 async def reset_metrics():
     """Reset application metrics"""
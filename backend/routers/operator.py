@@ -15,8 +15,9 @@ from backend.schemas import (
     CreateOperatorData,
     UpdateOperatorData,
 )
+from backend.core.routing import RequestConnectionRoute
 
-operator_router = APIRouter(tags=["Operator"])
+operator_router = APIRouter(tags=["Operator"], route_class=RequestConnectionRoute)
 
 
 @operator_router.get("/operators")
@@ -18,8 +18,9 @@ from backend.core.dependencies.user import get_current_user
 from backend.core.dependencies.database import DatabaseSessionDependency
 
 from backend.tasks.pbx import process_pbx_call_task
+from backend.core.routing import RequestConnectionRoute
 
-pbx_router = APIRouter(tags=["PBX Integration"])
+pbx_router = APIRouter(tags=["PBX Integration"], route_class=RequestConnectionRoute)
 
 
 @pbx_router.get("/pbx-operators")
@@ -16,8 +16,9 @@ from backend.services import settings
 from backend.core.dependencies.user import get_current_user, CurrentUser
 from backend.core.dependencies.database import DatabaseSessionDependency
 from backend.utils.shortcuts import model_to_dict
+from backend.core.routing import RequestConnectionRoute
 
-settings_router = APIRouter(tags=["Settings"])
+settings_router = APIRouter(tags=["Settings"], route_class=RequestConnectionRoute)
 
 
 @settings_router.get("/settings")
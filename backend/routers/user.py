@@ -29,9 +29,10 @@ from backend.services.credentials import (
 from backend.core.dependencies.database import DatabaseSessionDependency
 from backend.core.dependencies.user import get_current_user, CurrentUser
 from uuid import UUID
+from backend.core.routing import RequestConnectionRoute
 
 
-user_router = APIRouter(tags=["User"])
+user_router = APIRouter(tags=["User"], route_class=RequestConnectionRoute)
 
 
 @user_router.post("/signup")
@@ -84,7 +85,7 @@ def login(
 
 
 @user_router.post("/logout")
-async def logout(
+def logout(
     request: Request,
     db_session: DatabaseSessionDependency,
     current_user: User = Depends(get_current_user),
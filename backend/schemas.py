@@ -315,6 +315,15 @@ class ResultQueryParams(BaseModel):
     call_purpose: t.Optional[str] = None
 
 
+class BulkReprocessRecords(BaseModel):
+    # either explicit ids or the same filters `/audios_results` accepts
+    record_ids: t.Optional[list[UUID]] = None
+    record_filters: RecordQueryParams = RecordQueryParams()
+    result_filters: ResultQueryParams = ResultQueryParams()
+    checklist_id: t.Optional[UUID] = None
+    general: bool = False
+
+
 class ResultOrderQueries(BaseModel):
     # Ordering stuff, god forgive me.
     is_conversation_over_asc: t.Optional[bool | None] = None
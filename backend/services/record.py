@@ -3,7 +3,9 @@ import typing as t
 from uuid import UUID
 
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func, outerjoin
+from sqlalchemy import select, func, outerjoin, any_, cast
+from sqlalchemy.dialects.postgresql import ARRAY, UUID as PostgresUUID, array
+from sqlalchemy.sql.selectable import Select
 
 from backend.utils.parser import parse_order_by
 from backend.utils.shortcuts import get_filterable_values_for
@@ -191,6 +193,61 @@ def get_records_with_results(
         .where(Record.owner_id == owner_id)
     )
 
+    statement = filter_records_with_results(
+        statement,
+        operator_code=operator_code,
+        operator_name=operator_name,
+        call_type=call_type,
+        call_status=call_status,
+        client_phone_number=client_phone_number,
+        transcript_contains=transcript_contains,
+        is_conversation_over=is_conversation_over,
+        sentiment_analysis_of_conversation=sentiment_analysis_of_conversation,
+        sentiment_analysis_of_operator=sentiment_analysis_of_operator,
+        sentiment_analysis_of_customer=sentiment_analysis_of_customer,
+        is_customer_satisfied=is_customer_satisfied,
+        is_customer_agreed_to_buy=is_customer_agreed_to_buy,
+        is_customer_interested_to_product=is_customer_interested_to_product,
+        reason_for_customer_purchase=reason_for_customer_purchase,
+        which_platform_customer_found_about_the_course=(
+            which_platform_customer_found_about_the_course
+        ),
+        call_purpose=call_purpose,
+    )
+
+    logging.info(f"Result => {order_kwargs_result=} Record => {order_kwargs_record=}")
+
+    if order_clauses_record := parse_order_by(Record, order_kwargs_record):
+        statement = statement.order_by(*order_clauses_record)
+
+    if order_clauses_result := parse_order_by(Result, order_kwargs_result):
+        statement = statement.order_by(*order_clauses_result)
+
+    return compile_sql_query_and_params(statement)
+
+
+def filter_records_with_results(
+    statement: Select,
+    # record
+    operator_code: t.Optional[str] = None,
+    operator_name: t.Optional[str] = None,
+    call_type: t.Optional[str] = None,
+    call_status: t.Optional[str] = None,
+    client_phone_number: t.Optional[str] = None,
+    transcript_contains: t.Optional[str] = None,
+    # result
+    is_conversation_over: t.Optional[bool] = None,
+    sentiment_analysis_of_conversation: t.Optional[str] = None,
+    sentiment_analysis_of_operator: t.Optional[str] = None,
+    sentiment_analysis_of_customer: t.Optional[str] = None,
+    is_customer_satisfied: t.Optional[bool] = None,
+    is_customer_agreed_to_buy: t.Optional[bool] = None,
+    is_customer_interested_to_product: t.Optional[bool] = None,
+    reason_for_customer_purchase: t.Optional[str] = None,
+    which_platform_customer_found_about_the_course: t.Optional[str] = None,
+    call_purpose: t.Optional[str] = None,
+) -> Select:
+    """Applies record & result filters to a statement joining both tables"""
     # Filters for recording
     if operator_code:
         statement = statement.where(Record.operator_code == operator_code)
@@ -255,12 +312,34 @@ def get_records_with_results(
     if call_purpose:
         statement = statement.where(Result.call_purpose.contains(call_purpose))
 
-    logging.info(f"Result => {order_kwargs_result=} Record => {order_kwargs_record=}")
 
-    if order_clauses_record := parse_order_by(Record, order_kwargs_record):
-        statement = statement.order_by(*order_clauses_record)
+    return statement
 
-    if order_clauses_result := parse_order_by(Result, order_kwargs_result):
-        statement = statement.order_by(*order_clauses_result)
 
+def get_record_ids_with_results(
+    owner_id: UUID,
+    record_ids: t.Optional[list[UUID]] = None,
+    duration: t.Optional[int] = None,
+    **filter_params,
+):
+    """
+    Ids of the records `get_records_with_results` would return. `duration` of
+    `RecordQueryParams` has no filter behind it and is dropped.
+    """
+    statement = (
+        select(Record.id)
+        .distinct()
+        .select_from(outerjoin(Record, Result, Record.id == Result.record_id))
+        .where(Record.owner_id == owner_id)
+    )
+
+    if record_ids:
+        # expanding IN parameters can't be compiled to a plain query string,
+        # psycopg2 only adapts the ids as strings
+        record_ids = [str(record_id) for record_id in record_ids]
+        statement = statement.where(
+            Record.id == any_(cast(array(record_ids), ARRAY(PostgresUUID)))
+        )
+
+    statement = filter_records_with_results(statement, **filter_params)
     return compile_sql_query_and_params(statement)
@@ -0,0 +1,64 @@
+import logging
+import typing as t
+
+from backend import db
+from backend.core import settings
+from workers.common import celery as celery_app
+from utils.notifications import notifier
+from backend.utils.analyze import enqueue_reprocess_batch
+
+
+@celery_app.task(ignore_result=True)
+def bulk_reprocess_task(
+    bulk_id: str,
+    record_ids: list[str],
+    owner_id: str,
+    checklist_id: t.Optional[str],
+    general: bool,
+    folder_name: str,
+):
+    """
+    Fans reserved records out to the workers in batches, progress of every batch
+    is sent to the owner's socket room as a `reprocess` event. Records are read
+    batch by batch, those no longer reserved (PENDING) are skipped as failed.
+    """
+    total, enqueued, failed = len(record_ids), 0, []
+    batch_size = settings.BULK_REPROCESS_BATCH_SIZE
+
+    for start in range(0, total, batch_size):
+        batch_ids = record_ids[start : start + batch_size]
+        records, _ = db.get_records_and_results_by_ids(batch_ids)
+        batch = [
+            record
+            for record in records.values()
+            if str(record["owner_id"]) == owner_id and record["status"] == "PENDING"
+        ]
+        reserved_ids = {str(record["id"]) for record in batch}
+
+        batch_failed = enqueue_reprocess_batch(
+            batch, owner_id, checklist_id, general, folder_name
+        )
+        failed += [
+            record_id for record_id in batch_ids if record_id not in reserved_ids
+        ] + batch_failed
+        enqueued += len(batch) - len(batch_failed)
+        status = "DONE" if start + batch_size >= total else "RUNNING"
+
+        try:
+            notifier.emit(
+                "reprocess",
+                {
+                    "data": {
+                        "bulk_id": bulk_id,
+                        "total": total,
+                        "enqueued": enqueued,
+                        "failed": failed,
+                        "status": status,
+                    }
+                },
+                room=f"user/{owner_id}",
+            )
+        except Exception as exc:
+            logging.warning(f"Failed to report progress of {bulk_id=}: {exc}")
+
+    logging.info(f"Bulk reprocess {bulk_id=}: {enqueued=} of {total=}")
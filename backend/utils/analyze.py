@@ -14,14 +14,13 @@ from celery.result import AsyncResult
 from backend import db
 from backend.schemas import User
 from backend.core import settings
-from workers.data import upsert_data
 from utils.storage import upload_file
 from utils.data_manipulation import (
     find_operator_code,
     find_call_type,
     get_phone_number_from_filename,
 )
-from workers.api import api_processing
+from workers.pipeline import enqueue_processing
 from utils.audio import get_audio_duration
 from backend.utils.pbx import load_call_from_pbx
 from backend.utils.validators import validate_filename
@@ -115,7 +114,9 @@ def analyze_data_handler(
 
         if operator_code is not None:
             operator = (
-                db.get_operator_name_by_code(owner_id=owner_id, code=operator_code)
+                db.get_operator_name_by_code(
+                    owner_id=owner_id, code=operator_code, session=db_session
+                )
                 or {}
             )
             operator_name = operator.get("name", None)
@@ -133,7 +134,9 @@ def analyze_data_handler(
             "client_phone_number": client_phone_number,
         }
 
-        audio_record = db.upsert_record(record=record)
+        # same connection as the checklist lookup, committed before workers read it
+        audio_record = db.upsert_record(record=record, session=db_session)
+        db_session.commit()
 
         logging.warning(
             f"Audio record: {audio_record} with id: {record_id} and owner_id: {current_user.id}"
@@ -158,37 +161,21 @@ def analyze_data_handler(
                 os.remove(file_path)
             continue
 
-        task: AsyncResult = api_processing.apply_async(
-            kwargs={
-                "task": {
-                    "audio_record": audio_record,
-                    "checklist_id": single_checklist_id,
-                    "general": general,
-                    "folder_name": folder_name,
-                    "client_phone_number": client_phone_number,
-                },
+        task: AsyncResult = enqueue_processing(
+            task={
+                "audio_record": audio_record,
+                "checklist_id": single_checklist_id,
+                "general": general,
+                "folder_name": folder_name,
+                "client_phone_number": client_phone_number,
+            },
+            callback={
+                "task_id": task_id,
+                "owner_id": owner_id,
+                "record_id": audio_record["id"],
+                "checklist_id": single_checklist_id,
+                "storage_id": audio_record["storage_id"],
             },
-            link=upsert_data.s(
-                task={
-                    "task_id": task_id,
-                    "owner_id": owner_id,
-                    "record_id": audio_record["id"],
-                    "checklist_id": single_checklist_id,
-                    "storage_id": audio_record["storage_id"],
-                    "is_success": True,
-                }
-            ).set(queue="data"),
-            link_error=upsert_data.s(
-                task={
-                    "task_id": task_id,
-                    "owner_id": owner_id,
-                    "record_id": audio_record["id"],
-                    "checklist_id": single_checklist_id,
-                    "storage_id": audio_record["storage_id"],
-                    "is_success": False,
-                }
-            ).set(queue="data"),
-            queue="api",
             task_id=task_id,
         )
 
@@ -207,6 +194,43 @@ def analyze_data_handler(
     return JSONResponse(status_code=http_status.HTTP_200_OK, content=responses)
 
 
+def enqueue_reprocess_batch(
+    records: list[dict],
+    owner_id: str,
+    checklist_id: t.Optional[str],
+    general: bool,
+    folder_name: str,
+) -> list[str]:
+    """Enqueues already reserved (PENDING) records, returns ids that failed"""
+    failed = []
+
+    for record in records:
+        task_id = generate_task_id(owner_id)
+        try:
+            enqueue_processing(
+                task={
+                    "audio_record": record,
+                    "checklist_id": checklist_id,
+                    "general": general,
+                    "folder_name": folder_name,
+                },
+                callback={
+                    "task_id": task_id,
+                    "owner_id": owner_id,
+                    "record_id": str(record["id"]),
+                    "checklist_id": checklist_id,
+                    "storage_id": record["storage_id"],
+                },
+                task_id=task_id,
+            )
+        except Exception as exc:
+            logging.error(f"Failed to enqueue {record['id']=}: {exc}")
+            db.upsert_record(record={**record, "status": "FAILED"})
+            failed.append(str(record["id"]))
+
+    return failed
+
+
 def estimate_costs_from_pbx(
     request: Request,
     db_session: DatabaseSessionDependency,
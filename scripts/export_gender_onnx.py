@@ -0,0 +1,67 @@
+"""
+Exports keras gender model (MODEL_PATH) to ONNX (GENDER_ONNX_MODEL_PATH),
+required for INFERENCE_BACKEND=onnx. Needs `tf2onnx` next to tensorflow:
+
+    pip install tf2onnx
+    python -m scripts.export_gender_onnx --check
+"""
+
+import logging
+import argparse
+
+import numpy as np
+
+from workers.models import (
+    MODEL_PATH,
+    GENDER_ONNX_MODEL_PATH,
+    OnnxGenderModel,
+    load_gender_model,
+)
+
+
+def export(model_path: str, onnx_path: str) -> None:
+    import tensorflow as tf
+    import tf2onnx
+
+    model = load_gender_model(backend="keras", model_path=model_path)
+    input_signature = [
+        tf.TensorSpec((None, model.input_shape[-1]), tf.float32, name="features")
+    ]
+    tf2onnx.convert.from_keras(
+        model, input_signature=input_signature, opset=13, output_path=onnx_path
+    )
+    logging.warning(f"Exported {model_path} => {onnx_path}")
+
+
+def check_parity(
+    model_path: str, onnx_path: str, samples: int = 256, atol: float = 1e-5
+) -> float:
+    keras_model = load_gender_model(backend="keras", model_path=model_path)
+    onnx_model = OnnxGenderModel(onnx_path)
+
+    # mel features are non-negative power values, spread over a few decades
+    features = np.random.default_rng(0).lognormal(size=(samples, 128))
+    features = features.astype(np.float32)
+
+    difference = np.abs(
+        keras_model.predict_on_batch(features) - onnx_model.predict_on_batch(features)
+    ).max()
+
+    if difference > atol:
+        raise ValueError(f"ONNX model differs from keras one by {difference}")
+
+    return float(difference)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export gender model to ONNX")
+    parser.add_argument("--model-path", default=MODEL_PATH)
+    parser.add_argument("--onnx-path", default=GENDER_ONNX_MODEL_PATH)
+    parser.add_argument("--check", action="store_true", help="Run parity check")
+    args = parser.parse_args()
+
+    export(args.model_path, args.onnx_path)
+
+    if args.check:
+        difference = check_parity(args.model_path, args.onnx_path)
+        logging.warning(f"Max difference: {difference}")
@@ -0,0 +1,34 @@
+"""
+Tests for in-memory audio feature extraction
+"""
+
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip("librosa")
+
+from workers.audio import longest_segments, mel_features  # noqa: E402
+
+
+def test_cached_mel_features_match_librosa():
+    X = np.random.default_rng(0).standard_normal(22050 * 2).astype(np.float32)
+
+    expected = np.mean(librosa.feature.melspectrogram(y=X, sr=22050).T, axis=0)
+
+    assert mel_features(X, 22050).shape == (128,)
+    assert np.allclose(mel_features(X, 22050), expected)
+
+
+def test_longest_segments_keeps_chronological_order():
+    ranges = [
+        {"start": 0, "end": 5},
+        {"start": 10, "end": 30},
+        {"start": 40, "end": 45},
+        {"start": 50, "end": 60},
+    ]
+
+    assert longest_segments(ranges, 2) == [
+        {"start": 10, "end": 30},
+        {"start": 50, "end": 60},
+    ]
+    assert longest_segments([], 3) == []
@@ -0,0 +1,38 @@
+"""
+Tests for the bulk reprocess record selection
+"""
+
+from uuid import uuid4
+
+from backend.services.record import get_record_ids_with_results
+
+
+def test_record_ids_query_is_plain_sql():
+    """Compiled query has to be embeddable into the raw reservation query"""
+    record_ids = [str(uuid4()), str(uuid4())]
+    sql_query, params = get_record_ids_with_results(
+        uuid4(), record_ids=record_ids, call_type="incoming"
+    )
+
+    assert "POSTCOMPILE" not in sql_query
+    assert "ANY" in sql_query
+    assert set(record_ids) <= set(params.values())
+    assert "incoming" in params.values()
+
+
+def test_record_ids_query_uses_result_filters():
+    sql_query, params = get_record_ids_with_results(
+        uuid4(), is_customer_satisfied=True
+    )
+
+    assert "LEFT OUTER JOIN result" in sql_query
+    assert "is_customer_satisfied" in sql_query
+
+
+def test_record_ids_query_drops_duration():
+    sql_query, params = get_record_ids_with_results(
+        uuid4(), duration=60000, call_type="incoming"
+    )
+
+    assert 60000 not in params.values()
+    assert "incoming" in params.values()
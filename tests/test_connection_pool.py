@@ -0,0 +1,153 @@
+"""
+Tests for connection reuse of the raw SQL helpers on the SQLAlchemy engine pool
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend.database import utils
+from backend.database.utils import (
+    ConnectionWrapper,
+    async_request_connection,
+    db_connection_wrapper,
+    request_connection,
+)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.commits = 0
+
+    def close(self):
+        self.closed = True
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class FakeTransaction:
+    def __init__(self):
+        self.is_active = True
+        self.state = None
+
+    def commit(self):
+        self.is_active, self.state = False, "committed"
+
+    def rollback(self):
+        self.is_active, self.state = False, "rolled back"
+
+
+class FakeBind(FakeConnection):
+    """SQLAlchemy connection, records its transaction and savepoints"""
+
+    def __init__(self):
+        super().__init__()
+        self.connection = SimpleNamespace(driver_connection=FakeConnection())
+        self.transactions = []
+        self.savepoints = []
+
+    def begin(self):
+        self.transactions.append(FakeTransaction())
+        return self.transactions[-1]
+
+    def begin_nested(self):
+        self.savepoints.append(FakeTransaction())
+        return self.savepoints[-1]
+
+
+class FakeEngine:
+    def __init__(self):
+        self.opened = []
+
+    def connect(self):
+        self.opened.append(FakeBind())
+        return self.opened[-1]
+
+
+def test_request_reuses_one_connection(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(utils.sessionmanager, "_engine", engine)
+
+    with request_connection() as scope:
+        with ConnectionWrapper() as first, ConnectionWrapper() as second:
+            assert first is second
+        assert not first.closed
+        # the request's session is bound to the same connection
+        assert scope.get_bind().connection.driver_connection is first
+
+    assert len(engine.opened) == 1
+    assert engine.opened[0].closed
+
+
+def test_given_connection_is_not_committed(monkeypatch):
+    connection = FakeConnection()
+    monkeypatch.setattr(utils, "get_driver_connection", lambda bind: connection)
+
+    @db_connection_wrapper
+    def query(connection, value):
+        return connection, value
+
+    assert query(1, session=object()) == (connection, 1)
+    assert connection.commits == 0
+
+
+def test_async_scope_checks_out_lazily(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(utils.sessionmanager, "_engine", engine)
+
+    async def request(uses_db):
+        async with async_request_connection():
+            if uses_db:
+                with ConnectionWrapper():
+                    pass
+
+    asyncio.run(request(uses_db=False))
+    assert engine.opened == []
+
+    asyncio.run(request(uses_db=True))
+    assert len(engine.opened) == 1
+    assert engine.opened[0].closed
+
+
+def test_request_calls_are_savepoints_of_one_transaction(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(utils.sessionmanager, "_engine", engine)
+
+    @db_connection_wrapper
+    def query(connection, fail=False):
+        if fail:
+            raise ValueError(fail)
+
+    with request_connection():
+        query()
+        with pytest.raises(ValueError):
+            query(fail=True)
+
+    bind = engine.opened[0]
+    # session sharing the connection is never committed behind its back
+    assert bind.connection.driver_connection.commits == 0
+    assert [savepoint.state for savepoint in bind.savepoints] == [
+        "committed",
+        "rolled back",
+    ]
+    assert bind.transactions[0].state == "committed"
+
+
+def test_failed_request_is_rolled_back(monkeypatch):
+    engine = FakeEngine()
+    monkeypatch.setattr(utils.sessionmanager, "_engine", engine)
+
+    with pytest.raises(ValueError):
+        with request_connection():
+            with ConnectionWrapper():
+                pass
+            raise ValueError
+
+    assert engine.opened[0].transactions[0].state is None
+    assert engine.opened[0].closed
@@ -0,0 +1,46 @@
+"""
+Tests for splitting long conversations for map-reduce analysis
+"""
+
+from utils.data_manipulation import (
+    chunk_conversation,
+    convert_to_compact_chat,
+    estimate_tokens,
+    merge_checklist_responses,
+)
+
+
+def test_chunks_keep_speaker_turns_within_budget():
+    conversation = [
+        {"speaker": index % 2, "text": "salom " * 40, "start": index, "end": index}
+        for index in range(10)
+    ]
+
+    chunks = chunk_conversation(conversation, max_tokens=150)
+
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 150 for chunk in chunks)
+    assert sum(chunk.count("Speaker ") for chunk in chunks) == len(conversation)
+
+
+def test_checklist_question_is_asked_if_asked_in_any_part():
+    responses = [
+        {"Greeting": {"Said hello": True, "Asked name": False}},
+        {"Greeting": {"Said hello": False, "Asked name": True}},
+        {"Closing": {"Said bye": False}},
+    ]
+
+    assert merge_checklist_responses(responses) == {
+        "Greeting": {"Said hello": True, "Asked name": True},
+        "Closing": {"Said bye": False},
+    }
+
+
+def test_compact_chat_merges_speaker_turns():
+    offsets = [
+        {"speaker": 0, "word": "Assalomu", "start": 0.0, "end": 0.5},
+        {"speaker": 0, "word": "alaykum", "start": 0.5, "end": 1.0},
+        {"speaker": 1, "word": "Salom", "start": 1.2, "end": 1.6},
+    ]
+
+    assert convert_to_compact_chat(offsets) == "S0: Assalomu alaykum\nS1: Salom"
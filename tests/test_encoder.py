@@ -0,0 +1,39 @@
+"""
+Tests for JSON encoding of rows read by the raw SQL helpers
+"""
+
+import json
+import decimal
+import datetime
+from uuid import UUID, uuid4
+
+import pytest
+
+from utils.encoder import Encoder, adapt_json
+
+
+def test_row_with_uuid_columns_is_encoded():
+    row = {
+        "id": uuid4(),
+        "owner_id": uuid4(),
+        "duration": decimal.Decimal("1500"),
+        "created_at": datetime.datetime(2024, 1, 1),
+    }
+
+    encoded = json.loads(json.dumps(row, cls=Encoder))
+
+    assert encoded["id"] == str(row["id"])
+    assert encoded["owner_id"] == str(row["owner_id"])
+    assert adapt_json(row) == encoded
+
+
+def test_uuid_read_by_engine_connection_is_encoded():
+    """Engine pool connections have `register_uuid` applied by the dialect"""
+    extras = pytest.importorskip("psycopg2.extras")
+    uuid_caster = extras.register_uuid()
+    record_id = str(uuid4())
+
+    row = {"id": uuid_caster(record_id, None)}
+
+    assert isinstance(row["id"], UUID)
+    assert json.loads(json.dumps(row, cls=Encoder)) == {"id": record_id}
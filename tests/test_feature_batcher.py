@@ -0,0 +1,47 @@
+"""
+Tests for batched gender inference
+"""
+
+import threading
+
+import numpy as np
+
+from workers.batching import FeatureBatcher
+
+
+def test_concurrent_submissions_share_one_forward_pass():
+    calls = []
+
+    def predict_fn(batch):
+        calls.append(batch.shape)
+        return batch.sum(axis=1)
+
+    batcher = FeatureBatcher(predict_fn, max_batch_size=4, max_wait=0.5)
+    results = {}
+
+    def worker(index):
+        results[index] = batcher.predict(np.full(128, index, dtype=np.float32))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [(4, 128)]
+    assert results == {i: 128.0 * i for i in range(4)}
+    assert batcher.metrics.snapshot()["last_batch_size"] == 4
+
+
+def test_inline_batcher_scores_on_callers_thread():
+    threads = []
+
+    def predict_fn(batch):
+        threads.append(threading.current_thread())
+        return batch.sum(axis=1)
+
+    batcher = FeatureBatcher(predict_fn, max_wait=0.5, inline=True)
+
+    assert batcher.predict(np.ones(128, dtype=np.float32)) == 128.0
+    assert threads == [threading.current_thread()]
+    assert batcher._thread is None
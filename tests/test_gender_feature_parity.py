@@ -0,0 +1,155 @@
+"""
+Regression tests: gender model input has to match what the file based
+pipeline fed it (16 kHz VAD output re-read at 22050 Hz)
+"""
+
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip("librosa")
+sf = pytest.importorskip("soundfile")
+
+from workers.audio import (  # noqa: E402
+    VAD_SAMPLING_RATE,
+    FEATURE_SAMPLING_RATE,
+    decode_audio,
+    extract_features,
+    resample,
+    select_channel,
+    speech_features,
+)
+
+SOURCE_SAMPLING_RATE = 44100
+# speech segment picked by VAD, in VAD_SAMPLING_RATE samples
+SEGMENT = {"start": 8000, "end": 40000}
+
+
+@pytest.fixture
+def call_file(tmp_path):
+    """Stereo call with content above 8 kHz, client is on channel 1"""
+    t = np.arange(SOURCE_SAMPLING_RATE * 3) / SOURCE_SAMPLING_RATE
+    noise = np.random.default_rng(0).standard_normal(t.shape) * 0.01
+    client = (
+        0.4 * np.sin(2 * np.pi * 220 * t)
+        + 0.2 * np.sin(2 * np.pi * 1800 * t)
+        + 0.2 * np.sin(2 * np.pi * 10000 * t)
+        + noise
+    )
+    operator = 0.3 * np.sin(2 * np.pi * 440 * t)
+
+    path = tmp_path / "call.wav"
+    sf.write(path, np.stack([operator, client], axis=1), SOURCE_SAMPLING_RATE)
+    return str(path)
+
+
+def baseline_features(call_file, tmp_path) -> np.ndarray:
+    """Old pipeline: channel file -> 16 kHz VAD read -> speech file -> librosa.load"""
+    y, sr = librosa.load(call_file, mono=False)
+    channel_path = tmp_path / "channel.wav"
+    sf.write(channel_path, y[1], sr, subtype="FLOAT")
+
+    wav_16k, _ = librosa.load(channel_path, sr=VAD_SAMPLING_RATE)
+    speech_path = tmp_path / "speech.wav"
+    sf.write(
+        speech_path,
+        wav_16k[SEGMENT["start"] : SEGMENT["end"]],
+        VAD_SAMPLING_RATE,
+        subtype="FLOAT",
+    )
+
+    X, sample_rate = librosa.load(speech_path)
+    return np.mean(librosa.feature.melspectrogram(y=X, sr=sample_rate).T, axis=0)
+
+
+def test_in_memory_features_match_file_pipeline(call_file, tmp_path):
+    y, sample_rate = decode_audio(call_file, VAD_SAMPLING_RATE)
+    speech = select_channel(y, 1)[SEGMENT["start"] : SEGMENT["end"]]
+    features = extract_features(
+        resample(speech, sample_rate, FEATURE_SAMPLING_RATE),
+        FEATURE_SAMPLING_RATE,
+        mel=True,
+    )
+
+    expected = baseline_features(call_file, tmp_path)
+
+    assert features.shape == (128,)
+    assert np.allclose(features, expected, rtol=0.05, atol=1e-3 * expected.max())
+
+
+def test_speech_features_match_file_pipeline(call_file, tmp_path):
+    """Shared by the in-memory and the streaming path, both pass 16 kHz speech"""
+    y, _ = decode_audio(call_file, VAD_SAMPLING_RATE)
+    speech = select_channel(y, 1)[SEGMENT["start"] : SEGMENT["end"]]
+
+    expected = baseline_features(call_file, tmp_path)
+
+    assert np.allclose(
+        speech_features(speech), expected, rtol=0.05, atol=1e-3 * expected.max()
+    )
+
+
+def test_full_band_features_would_drift(call_file, tmp_path):
+    """Guards the test above, it has to tell the band limited input apart"""
+    y, sample_rate = decode_audio(call_file)
+    ratio = sample_rate / VAD_SAMPLING_RATE
+    speech = select_channel(y, 1)[
+        int(SEGMENT["start"] * ratio) : int(SEGMENT["end"] * ratio)
+    ]
+    features = extract_features(speech, sample_rate, mel=True)
+
+    expected = baseline_features(call_file, tmp_path)
+
+    assert not np.allclose(features, expected, rtol=0.05, atol=1e-3 * expected.max())
+
+
+def test_predict_task_features_match_file_pipeline(call_file, tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("celery")
+    from workers.common import PredictTask
+
+    monkeypatch.setattr(PredictTask, "model", property(lambda self: None))
+    monkeypatch.setattr(
+        PredictTask,
+        "get_speech_timestamps",
+        property(lambda self: lambda *args, **kwargs: [dict(SEGMENT)]),
+    )
+
+    extracted = PredictTask().extract_speaker_features(
+        call_file, "call.wav", duration=3
+    )
+
+    expected = baseline_features(call_file, tmp_path)
+    assert np.allclose(
+        extracted["features"], expected, rtol=0.05, atol=1e-3 * expected.max()
+    )
+
+
+def test_no_speech_fallback_matches_between_paths(call_file, monkeypatch):
+    """Without speech both paths score the whole client channel"""
+    pytest.importorskip("torch")
+    pytest.importorskip("celery")
+    import workers.common as common
+    from workers.common import PredictTask
+
+    monkeypatch.setattr(PredictTask, "model", property(lambda self: None))
+    monkeypatch.setattr(
+        PredictTask,
+        "get_speech_timestamps",
+        property(lambda self: lambda *args, **kwargs: []),
+    )
+    monkeypatch.setattr(
+        PredictTask,
+        "VADIterator",
+        property(lambda self: lambda *args, **kwargs: None),
+    )
+    monkeypatch.setattr(common, "stream_speech_segments", lambda *args: iter([]))
+
+    task = PredictTask()
+    in_memory = task.extract_speaker_features(call_file, "call.wav", duration=3)
+    streaming = task.extract_speaker_features(
+        call_file, "call.wav", duration=common.VAD_STREAMING_MIN_DURATION
+    )
+
+    assert in_memory["duration_after"] == pytest.approx(3)
+    assert streaming["duration_after"] == in_memory["duration_after"]
+    assert np.allclose(streaming["features"], in_memory["features"])
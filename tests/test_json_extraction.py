@@ -0,0 +1,48 @@
+"""
+Tests for extracting JSON objects from model responses
+"""
+
+from utils.data_manipulation import JsonStreamExtractor, extract_json
+
+
+def test_nested_objects_are_not_truncated():
+    response = """'''json
+    {
+        "Greeting": {"Said hello": true, "Asked name": false},
+        "Closing": {"Said \\"bye}\\"": true}
+    }
+    '''"""
+
+    assert extract_json(response) == {
+        "Greeting": {"Said hello": True, "Asked name": False},
+        "Closing": {'Said "bye}"': True},
+    }
+
+
+def test_python_literals_are_accepted():
+    assert extract_json('{"age": None, "over": True,}') == {
+        "age": None,
+        "over": True,
+    }
+
+
+def test_literals_inside_strings_are_not_rewritten():
+    response = (
+        '{"answer": "None, True or False,}", "asked": False, "note": "a \\"True\\"",}'
+    )
+
+    assert extract_json(response) == {
+        "answer": "None, True or False,}",
+        "asked": False,
+        "note": 'a "True"',
+    }
+
+
+def test_streamed_object_is_returned_once_closed():
+    extractor = JsonStreamExtractor()
+
+    assert extractor.feed('Here you go: {"summary": "{') is None
+    assert extractor.feed('not a brace", "a": {"b": 1}') is None
+    assert extractor.feed("} and some trailing text") == (
+        '{"summary": "{not a brace", "a": {"b": 1}}'
+    )
@@ -0,0 +1,31 @@
+"""
+Tests for the worker side socket notifications
+"""
+
+import json
+
+from utils.notifications import Notifier
+
+
+class FakeRedis:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+def test_message_matches_socketio_pubsub_format():
+    client = FakeRedis()
+    notifier = Notifier(client=client)
+
+    notifier.emit("result", {"data": {"status": "FAILED"}}, room="user/1")
+
+    channel, message = client.published[0]
+    message = json.loads(message)
+    assert channel == "socketio"
+    assert message["method"] == "emit"
+    assert message["event"] == "result"
+    assert message["room"] == "user/1"
+    assert message["namespace"] == "/"
+    assert message["data"] == {"data": {"status": "FAILED"}}
@@ -0,0 +1,52 @@
+"""
+Parity of the ONNX Runtime inference backend with the current torch/keras one
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from workers.models import MODEL_PATH, GENDER_ONNX_MODEL_PATH
+
+pytest.importorskip("onnxruntime")
+
+
+@pytest.mark.skipif(
+    not (os.path.exists(MODEL_PATH) and os.path.exists(GENDER_ONNX_MODEL_PATH)),
+    reason="gender model weights are not available",
+)
+def test_gender_model_parity():
+    pytest.importorskip("tensorflow")
+    from scripts.export_gender_onnx import check_parity
+
+    assert check_parity(MODEL_PATH, GENDER_ONNX_MODEL_PATH, atol=1e-5) <= 1e-5
+
+
+def test_silero_vad_parity():
+    pytest.importorskip("torch")
+    from workers.models import load_silero_vad
+
+    try:
+        jit_model, _ = load_silero_vad(onnx=False)
+        onnx_model, _ = load_silero_vad(onnx=True)
+    except Exception as exc:
+        pytest.skip(f"silero vad is not available: {exc}")
+
+    import torch
+
+    sampling_rate, window = 16000, 512
+    timeline = np.arange(sampling_rate * 2) / sampling_rate
+    rng = np.random.default_rng(0)
+    # voiced-like harmonic bursts over background noise
+    wav = 0.3 * np.sin(2 * np.pi * 220 * timeline) * (timeline % 0.5 < 0.25)
+    wav = (wav + 0.01 * rng.standard_normal(len(wav))).astype(np.float32)
+
+    jit_model.reset_states()
+    onnx_model.reset_states()
+
+    for offset in range(0, len(wav) - window + 1, window):
+        chunk = torch.from_numpy(wav[offset : offset + window])
+        jit_prob = jit_model(chunk, sampling_rate).item()
+        onnx_prob = onnx_model(chunk, sampling_rate).item()
+        assert abs(jit_prob - onnx_prob) < 1e-2
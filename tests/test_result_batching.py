@@ -0,0 +1,113 @@
+"""
+Tests for batched result persistence of the data worker
+"""
+
+import json
+
+from workers import data
+from workers.data import build_update, fill_missing_keys, get_task_result
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.calls]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.lists = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def rpush(self, key, *items):
+        self.lists.setdefault(key, []).extend(items)
+
+    def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    def lmove(self, source, destination):
+        if not self.lists.get(source):
+            return None
+        item = self.lists[source].pop(0)
+        if not self.lists[source]:
+            del self.lists[source]
+        self.rpush(destination, item)
+        return item
+
+    def delete(self, key):
+        self.lists.pop(key, None)
+
+
+def test_failed_task_only_changes_status():
+    task = {
+        "task_id": "owner/result-id",
+        "record_id": "record-id",
+        "owner_id": "owner",
+        "checklist_id": None,
+    }
+    update = build_update(task, None, {"id": "record-id"}, {"checklist_id": "c"})
+
+    assert update["status"] == "FAILED"
+    assert update["result"] is None
+    assert update["event"]["checklist_id"] == "c"
+
+
+def test_missing_columns_keep_existing_values():
+    results = [
+        {"id": "1", "record_id": "a", "summary": "new"},
+        {"id": "2", "record_id": "b", "call_purpose": "sale"},
+    ]
+    existing_results = {"a": {"call_purpose": "support", "summary": "old"}}
+
+    rows = fill_missing_keys(results, existing_results)
+
+    assert rows[0] == {
+        "id": "1",
+        "record_id": "a",
+        "summary": "new",
+        "call_purpose": "support",
+    }
+    assert rows[1]["summary"] is None
+    assert [list(row) for row in rows] == [list(rows[0])] * 2
+
+
+def test_parent_result_is_used_without_backend():
+    task = {"task_id": "owner/result-id", "is_success": True}
+    parent_result = {"general_response": {}, "checklist_response": {}}
+
+    assert get_task_result(task, parent_result) is parent_result
+    assert get_task_result({**task, "is_success": False}, parent_result) is None
+
+
+def test_failed_items_are_kept(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(data, "redis_client", client)
+    monkeypatch.setattr(data, "DATA_FLUSH_MAX_ATTEMPTS", 2)
+    task = {"task_id": "owner/result-id"}
+    client.rpush(data.PENDING_RESULTS_KEY, json.dumps({"task": task, "result": None}))
+
+    items = data.pop_results(10)
+    # a flush that died before acking leaves its batch to the next one
+    assert data.pop_results(10) == items
+
+    data.ack_results(items)
+    assert data.PROCESSING_RESULTS_KEY not in client.lists
+    assert data.pop_results(10)[0]["attempts"] == 1
+
+    data.ack_results(data.pop_results(10))
+    assert data.PENDING_RESULTS_KEY not in client.lists
+    assert len(client.lists[data.FAILED_RESULTS_KEY]) == 1
@@ -0,0 +1,118 @@
+import json
+import time
+import logging
+import typing as t
+
+from redis import Redis
+
+from utils.encoder import Encoder
+from utils.redis_utils import redis_client
+
+
+class ArtifactCache:
+    """
+    Redis backed cache of JSON artifacts, bounded in two ways:
+      - every entry expires after `ttl` seconds
+      - at most `max_entries` are kept, least recently used ones are evicted
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: int,
+        max_entries: int,
+        client: t.Optional[Redis] = None,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.client = client or redis_client
+        self.index_key = f"{namespace}:__lru__"
+
+    def key(self, artifact_id: str) -> str:
+        return f"{self.namespace}:{artifact_id}"
+
+    def get(self, artifact_id: str) -> dict | None:
+        try:
+            value = self.client.get(self.key(artifact_id))
+            if value is None:
+                return None
+
+            with self.client.pipeline(transaction=False) as pipeline:
+                pipeline.expire(self.key(artifact_id), self.ttl)
+                pipeline.zadd(self.index_key, {artifact_id: time.time()})
+                pipeline.execute()
+
+            return json.loads(value)
+        except Exception as exc:
+            # cache must never break the processing itself
+            logging.error(f"Artifact cache get failed {artifact_id=}: {exc}")
+            return None
+
+    def set(self, artifact_id: str, value: dict) -> bool:
+        try:
+            with self.client.pipeline(transaction=False) as pipeline:
+                pipeline.set(
+                    self.key(artifact_id),
+                    json.dumps(value, cls=Encoder),
+                    ex=self.ttl,
+                )
+                pipeline.zadd(self.index_key, {artifact_id: time.time()})
+                pipeline.zcard(self.index_key)
+                *_, size = pipeline.execute()
+
+            if size > self.max_entries:
+                self.evict(size - self.max_entries)
+
+            return True
+        except Exception as exc:
+            logging.error(f"Artifact cache set failed {artifact_id=}: {exc}")
+            return False
+
+    def update(self, artifact_id: str, **fields) -> bool:
+        """Merges `fields` into the entry, concurrent updates are retried (WATCH)"""
+        key = self.key(artifact_id)
+
+        def merge(pipeline):
+            value = pipeline.get(key)
+            merged = {**(json.loads(value) if value is not None else {}), **fields}
+
+            pipeline.multi()
+            pipeline.set(key, json.dumps(merged, cls=Encoder), ex=self.ttl)
+            pipeline.zadd(self.index_key, {artifact_id: time.time()})
+            pipeline.zcard(self.index_key)
+
+        try:
+            *_, size = self.client.transaction(merge, key)
+
+            if size > self.max_entries:
+                self.evict(size - self.max_entries)
+
+            return True
+        except Exception as exc:
+            logging.error(f"Artifact cache update failed {artifact_id=}: {exc}")
+            return False
+
+    def delete(self, artifact_id: str) -> None:
+        try:
+            with self.client.pipeline(transaction=False) as pipeline:
+                pipeline.delete(self.key(artifact_id))
+                pipeline.zrem(self.index_key, artifact_id)
+                pipeline.execute()
+        except Exception as exc:
+            logging.error(f"Artifact cache delete failed {artifact_id=}: {exc}")
+
+    def evict(self, count: int) -> None:
+        evicted = self.client.zpopmin(self.index_key, count)
+        if evicted:
+            self.client.delete(
+                *[
+                    self.key(
+                        artifact_id.decode()
+                        if isinstance(artifact_id, bytes)
+                        else artifact_id
+                    )
+                    for artifact_id, _ in evicted
+                ]
+            )
+            logging.info(f"Evicted {len(evicted)} entries from {self.namespace}")
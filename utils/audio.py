@@ -1,5 +1,7 @@
+import hashlib
 import logging
 import subprocess
+import typing as t
 
 
 def generate_waveform(input_path, output_path):
@@ -47,3 +49,35 @@ def get_audio_duration(local_path):
         logging.error(f"Error getting audio duration: {e}")
 
     return duration
+
+
+def get_audio_channels(local_path):
+    channels = None
+
+    try:
+        command = [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "a:0",
+            "-show_entries",
+            "stream=channels",
+            "-of",
+            "default=noprint_wrappers=1:nokey=1",
+            local_path,
+        ]
+        result = subprocess.run(command, capture_output=True)
+        if result.returncode == 0:
+            channels = int(result.stdout.strip())
+    except Exception as e:
+        logging.error(f"Error getting audio channels: {e}")
+
+    return channels
+
+
+def file_md5(file: t.BinaryIO, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.md5()
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
@@ -1,4 +1,3 @@
-import re
 import json
 import logging  # noqa: F401
 
@@ -16,18 +15,119 @@ def convert_string_to_json(input_str):
         return {"error": f"Failed to decode JSON: {str(e)}"}
 
 
-def extract_json_from_markdown(input_str):
-    # Trim the markdown code block syntax and any leading/trailing whitespace
-    trimmed_str = input_str.strip("` \n")
+class JsonStreamExtractor:
+    """
+    Brace balanced extraction of the first complete JSON object from text which
+    may arrive in pieces (e.g. a streamed completion). Nested objects and braces
+    inside strings are handled, markdown fences and prose around it are skipped.
+    """
+
+    def __init__(self):
+        self.buffer: list[str] = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.text: str | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.text is not None
+
+    def feed(self, chunk: str) -> str | None:
+        """Returns the object text as soon as it is closed, None until then"""
+        if self.done:
+            return self.text
+
+        for char in chunk:
+            if self.depth == 0 and char != "{":
+                continue
+
+            self.buffer.append(char)
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == "{":
+                self.depth += 1
+            elif char == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.text = "".join(self.buffer)
+                    return self.text
+
+        return None
+
+
+PYTHON_LITERALS: dict[str, str] = {"None": "null", "True": "true", "False": "false"}
+
+
+def repair_json(text: str) -> str:
+    """
+    Rewrites python literals & drops trailing commas, the usual model mistakes.
+    Quoted spans are copied as is, so answers containing "None," stay intact.
+    """
+    repaired = []
+    i, length = 0, len(text)
+
+    while i < length:
+        char = text[i]
+
+        if char == '"':
+            end = i + 1
+            while end < length and text[end] != '"':
+                end += 2 if text[end] == "\\" else 1
+            repaired.append(text[i : end + 1])
+            i = end + 1
+        elif char.isalpha() or char == "_":
+            end = i
+            while end < length and (text[end].isalnum() or text[end] == "_"):
+                end += 1
+            word = text[i:end]
+            repaired.append(PYTHON_LITERALS.get(word, word))
+            i = end
+        elif char == ",":
+            end = i + 1
+            while end < length and text[end].isspace():
+                end += 1
+            if end < length and text[end] in "}]":
+                i = end
+            else:
+                repaired.append(char)
+                i += 1
+        else:
+            repaired.append(char)
+            i += 1
 
-    # Use regular expressions to extract JSON text within the curly braces, including nested braces
-    pattern = r"\{[\s\S]*?\}"
-    match = re.search(pattern, trimmed_str)
+    return "".join(repaired)
 
-    if match:
-        return match.group(0)  # Return the matched JSON string
-    else:
-        return ""
+
+def loads_json_object(text: str) -> dict | None:
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(repair_json(text))
+        except json.JSONDecodeError:
+            return None
+
+    return data if isinstance(data, dict) else None
+
+
+def extract_json(input_str: str) -> dict | None:
+    """First JSON object of a model response, None if there is no valid one"""
+    text = JsonStreamExtractor().feed(input_str)
+    return loads_json_object(text) if text is not None else None
+
+
+def extract_json_from_markdown(input_str):
+    # first brace balanced object, nested objects included
+    return JsonStreamExtractor().feed(input_str) or ""
 
 
 def convert_to_chat(data):
@@ -48,6 +148,17 @@ def convert_to_chat(data):
     return chat.strip()
 
 
+def convert_to_compact_chat(data, speaker_prefix="S"):
+    """
+    Same conversation as `convert_to_chat` in fewer tokens: short speaker tags,
+    one line per speaker turn, no trailing whitespace.
+    """
+    return "\n".join(
+        f"{speaker_prefix}{turn['speaker']}: {turn['text']}"
+        for turn in process_transcription(data)
+    )
+
+
 def process_transcription(data):
     # Initialize a list to hold the structured conversation
     structured_conversation = []
@@ -100,6 +211,73 @@ def process_transcription(data):
     return structured_conversation
 
 
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token, good enough for budgeting
+    return len(text) // 4 + 1
+
+
+def chunk_conversation(
+    conversation,
+    max_tokens: int,
+    count_tokens=estimate_tokens,
+    speaker_prefix: str = "Speaker ",
+) -> list[str]:
+    """
+    Packs speaker turns of `process_transcription` output into "Speaker N: ..."
+    (`speaker_prefix`) chunks of at most `max_tokens`. Turns are only split if
+    a single one is longer than the budget, then at word boundaries.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n".join(current))
+        current, current_tokens = [], 0
+
+    for turn in conversation:
+        line = f"{speaker_prefix}{turn['speaker']}: {turn['text']}"
+        tokens = count_tokens(line)
+
+        if tokens > max_tokens:
+            flush()
+            words = turn["text"].split(" ")
+            step = max(len(words) * max_tokens // tokens, 1)
+            for i in range(0, len(words), step):
+                chunks.append(
+                    f"{speaker_prefix}{turn['speaker']}: "
+                    + " ".join(words[i : i + step])
+                )
+            continue
+
+        if current_tokens + tokens > max_tokens:
+            flush()
+
+        current.append(line)
+        current_tokens += tokens
+
+    flush()
+    return chunks
+
+
+def merge_checklist_responses(responses: list[dict]) -> dict:
+    """Question counts as asked if it was asked in any part of the conversation"""
+    merged: dict = {}
+
+    for response in responses:
+        for segment, answers in response.items():
+            if not isinstance(answers, dict):
+                continue
+            merged_answers = merged.setdefault(segment, {})
+            for question, asked in answers.items():
+                merged_answers[question] = (
+                    merged_answers.get(question) is True or asked is True
+                )
+
+    return merged
+
+
 def calculate_pause_duration(conversations, operator, customer):
     total_pause_duration = 0
     last_customer_end_time = None
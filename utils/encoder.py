@@ -1,4 +1,5 @@
 import json
+import uuid
 import decimal
 import datetime
 
@@ -11,6 +12,10 @@ class Encoder(json.JSONEncoder):
         if isinstance(o, decimal.Decimal):
             return float(o)
 
+        # psycopg2 connections of the engine pool return uuid columns as UUID
+        if isinstance(o, uuid.UUID):
+            return str(o)
+
         return super(Encoder, self).default(o)
 
 
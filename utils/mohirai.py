@@ -1,10 +1,32 @@
-import time
+import asyncio
 import logging
-import requests
-from pydub import AudioSegment
-from ratelimit import limits, sleep_and_retry
+import typing as t
+
+import httpx
+from decouple import config
 
 from backend.core import settings
+from utils.audio import get_audio_duration
+from utils.rate_limit import mohirai_bucket
+
+MOHIRAI_TASKS_URL: str = "https://uzbekvoice.ai/api/v1/tasks"
+
+# polling interval grows by this factor after every not yet finished check
+STT_POLL_BACKOFF: float = config("STT_POLL_BACKOFF", cast=float, default=1.5)
+STT_POLL_MAX_INTERVAL: float = config(
+    "STT_POLL_MAX_INTERVAL", cast=float, default=60
+)
+
+SUBMIT_DATA = {
+    "return_offsets": "true",
+    "run_diarization": "true",
+    "language": "uz",
+    "blocking": "false",
+}
+
+
+class MohirAIError(Exception):
+    """Transcription task failed on MohirAI side, polling it again won't help"""
 
 
 def calculate_sleep_time(duration_minutes):
@@ -21,79 +43,110 @@ def calculate_sleep_time(duration_minutes):
     return 8
 
 
-@sleep_and_retry
-@limits(calls=5, period=60)
-def mohirAI(file_path):
-    logging.warning(f"Processing file in mohirAI function: {file_path}")
-    api_key = settings.MOHIRAI_API_KEY
+def next_poll_interval(interval: float) -> float:
+    return min(interval * STT_POLL_BACKOFF, STT_POLL_MAX_INTERVAL)
 
-    url = "https://uzbekvoice.ai/api/v1/stt"
-    headers = {"Authorization": api_key}
 
-    files = {"file": ("audio.mp3", open(file_path, "rb"))}
-    data = {
-        "return_offsets": "true",
-        "run_diarization": "true",
-        "language": "uz",
-        "blocking": "false",
-    }
+class AsyncMohirAI:
+    """
+    Non blocking MohirAI client, only submits files and checks task status.
+    Waiting for the transcript is up to the caller (see workers.stt).
+    """
 
-    audio = AudioSegment.from_file(file_path)
-    duration_ms = len(audio)
-    duration_minutes = duration_ms / 60000
-    poll_interval = calculate_sleep_time(duration_minutes)
+    def __init__(self, api_key: str | None = None, timeout: float = 120.0):
+        self.api_key = api_key or settings.MOHIRAI_API_KEY
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            headers={"Authorization": self.api_key},
+            limits=httpx.Limits(max_connections=100),
+        )
 
-    print(f"Audio length: {duration_minutes:.2f} minutes")
-    print(f"Poll interval (sleep time): {poll_interval} seconds")
+    async def __aenter__(self):
+        return self
 
-    try:
-        general_response = requests.post(url, headers=headers, files=files, data=data)
-        print("General Response is now printing")
-        print(general_response)
-        if general_response.status_code != 200:
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def submit(self, source: str | t.BinaryIO) -> str:
+        """
+        Uploads `source` (path or binary file object) and returns MohirAI task id.
+        File is streamed in chunks, it is never read into memory as a whole.
+        """
+        logging.warning(f"Submitting file to mohirAI: {source}")
+        await mohirai_bucket().acquire_async()
+
+        if isinstance(source, str):
+            with open(source, "rb") as file:
+                response = await self._upload(file)
+        else:
+            response = await self._upload(source)
+
+        if response.status_code != 200:
             logging.error(
-                f"Request failed with status code {general_response.status_code}: {general_response.text}"
+                f"Request failed with status code {response.status_code}: {response.text}"
             )
-            general_response.raise_for_status()
+            response.raise_for_status()
 
-        response_data = general_response.json()
-        task_id = response_data["id"]
+        return response.json()["id"]
 
-        print("response data")
-        print(response_data)
-        task_id_temp = response_data["id"]
-        print("Temp resp data")
-        print(task_id_temp)
+    async def _upload(self, file: t.BinaryIO) -> httpx.Response:
+        return await self.client.post(
+            settings.MOHIRAI_API_URL,
+            files={"file": ("audio.mp3", file)},
+            data=SUBMIT_DATA,
+        )
 
-        url = f"https://uzbekvoice.ai/api/v1/tasks?id={task_id}"
-        headers = {"Authorization": api_key, "Content-Type": "application/json"}
+    async def fetch(self, task_id: str) -> dict | None:
+        """Finished transcription of `task_id` or None if it is still in progress"""
+        response = await self.client.get(MOHIRAI_TASKS_URL, params={"id": task_id})
 
-        while True:
-            print("Started sleeping")
-            time.sleep(poll_interval)
-            print("Sleep end")
-            response = requests.get(url, headers=headers)
-            print("Task polling result")
-            print(response)
+        if response.status_code == 200:
             result = response.json()
-            print("Print data for ID from result")
-            print(result)
-            if response.status_code == 200:
-                if result["status"] == "SUCCESS":
-                    return result
-            elif response.status_code in [404, 408, 500]:
-                logging.error(
-                    f"Task {task_id} failed with code:{response.status_code} and body:{result}"
-                )
-                raise Exception(
-                    f"Task {task_id} failed with code:{response.status_code}"
-                )
-            else:
-                logging.warning(
-                    f"Request failed with status code {response.status_code}: {response.text}"
-                )
-                response.raise_for_status()
-
-    except requests.exceptions.RequestException as e:
+            return result if result["status"] == "SUCCESS" else None
+
+        if response.status_code in [404, 408, 500]:
+            logging.error(
+                f"Task {task_id} failed with code:{response.status_code} and body:{response.text}"
+            )
+            raise MohirAIError(
+                f"Task {task_id} failed with code:{response.status_code}"
+            )
+
+        logging.warning(
+            f"Request failed with status code {response.status_code}: {response.text}"
+        )
+        response.raise_for_status()
+        return None
+
+
+async def transcribe_async(file_path: str, duration_minutes: float) -> dict:
+    async with AsyncMohirAI() as client:
+        task_id = await client.submit(file_path)
+        interval = calculate_sleep_time(duration_minutes)
+
+        while True:
+            await asyncio.sleep(interval)
+            result = await client.fetch(task_id)
+            if result is not None:
+                return result
+            interval = next_poll_interval(interval)
+
+
+def mohirAI(file_path, duration_ms: float | None = None):
+    """Blocking transcription, used by the monolithic `api_processing` task"""
+    logging.warning(f"Processing file in mohirAI function: {file_path}")
+
+    if duration_ms is None:
+        # header only probe, the file is not decoded
+        duration_ms = (get_audio_duration(file_path) or 0) * 1000
+    duration_minutes = duration_ms / 60000
+    logging.info(f"Audio length: {duration_minutes:.2f} minutes")
+
+    try:
+        return asyncio.run(transcribe_async(file_path, duration_minutes))
+    except httpx.HTTPError as e:
         logging.error(f"MohirAI request failed: {e}")
         raise e
@@ -0,0 +1,62 @@
+"""
+Socket.IO notifications for workers, without the socketio server stack.
+
+Messages are published to the redis channel `socketio.AsyncRedisManager` of
+`backend.sockets` listens on, in the format its pubsub listener understands,
+the web servers then deliver them to the connected clients of the room.
+"""
+
+import json
+import uuid
+import typing as t
+
+from redis import Redis
+
+from utils.encoder import Encoder
+from utils.redis_utils import redis_client
+
+SOCKETIO_CHANNEL: str = "socketio"
+
+
+class Notifier:
+    """Publishes socket events over one long lived redis connection pool"""
+
+    def __init__(
+        self, client: t.Optional[Redis] = None, channel: str = SOCKETIO_CHANNEL
+    ):
+        self.client = client or redis_client
+        self.channel = channel
+        # listeners skip messages of their own host, never one of ours
+        self.host_id = uuid.uuid4().hex
+
+    def message(
+        self, event: str, data: t.Any, room: t.Optional[str] = None, namespace="/"
+    ) -> str:
+        return json.dumps(
+            {
+                "method": "emit",
+                "event": event,
+                "data": data,
+                "namespace": namespace,
+                "room": room,
+                "skip_sid": None,
+                "callback": None,
+                "host_id": self.host_id,
+            },
+            cls=Encoder,
+        )
+
+    def emit(
+        self, event: str, data: t.Any, room: t.Optional[str] = None, namespace="/"
+    ) -> None:
+        self.client.publish(self.channel, self.message(event, data, room, namespace))
+
+    def emit_many(self, events: t.Iterable[tuple[str, t.Any, str]]) -> None:
+        """(event, data, room) each, sent in one round trip"""
+        with self.client.pipeline(transaction=False) as pipeline:
+            for event, data, room in events:
+                pipeline.publish(self.channel, self.message(event, data, room))
+            pipeline.execute()
+
+
+notifier = Notifier()
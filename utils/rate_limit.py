@@ -0,0 +1,165 @@
+import time
+import asyncio
+import logging
+import typing as t
+
+from redis import Redis
+from decouple import config
+
+from utils.redis_utils import redis_client
+
+# calls per minute, shared by every worker process
+MOHIRAI_REQUESTS_PER_MINUTE: float = config(
+    "MOHIRAI_REQUESTS_PER_MINUTE", cast=float, default=5
+)
+OPENAI_REQUESTS_PER_MINUTE: float = config(
+    "OPENAI_REQUESTS_PER_MINUTE", cast=float, default=300
+)
+# 0 disables the tokens per minute bucket
+OPENAI_TOKENS_PER_MINUTE: float = config(
+    "OPENAI_TOKENS_PER_MINUTE", cast=float, default=0
+)
+
+# Refills the bucket and reserves `cost` tokens in one step. Tokens may go below
+# zero: every caller gets the next free slot in arrival order (fair FIFO) and is
+# told how long to wait for it, instead of all of them retrying at once.
+RESERVE_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated_at")
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+
+tokens = math.min(capacity, tokens + math.max(now - updated_at, 0) * rate)
+tokens = tokens - cost
+
+redis.call("HSET", KEYS[1], "tokens", tokens, "updated_at", now)
+redis.call("EXPIRE", KEYS[1], math.ceil((capacity - tokens) / rate) + 60)
+
+local wait = 0
+if tokens < 0 then
+    wait = -tokens / rate
+end
+
+return {tostring(wait), tostring(tokens)}
+"""
+
+
+class TokenBucket:
+    """
+    Redis backed token bucket, `rate` tokens per `period` seconds up to `capacity`.
+    One bucket is shared by all processes using the same `name`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        period: float = 60,
+        capacity: float | None = None,
+        client: t.Optional[Redis] = None,
+    ):
+        self.name = name
+        self.key = f"rate-limit:{name}"
+        self.rate = rate / period
+        self.capacity = capacity if capacity is not None else rate
+        self.client = client or redis_client
+        self.script = self.client.register_script(RESERVE_SCRIPT)
+
+    def reserve(self, cost: float = 1) -> float:
+        """Reserves `cost` tokens, returns seconds to wait before using them"""
+        try:
+            wait, _ = self.script(
+                keys=[self.key], args=[self.rate, self.capacity, cost]
+            )
+            return float(wait)
+        except Exception as exc:
+            # limiter must never stop the processing, fall back to no limit
+            logging.error(f"Rate limiter {self.name} failed: {exc}")
+            return 0.0
+
+    def acquire(self, cost: float = 1) -> float:
+        wait = self.reserve(cost)
+        if wait > 0:
+            logging.info(f"Rate limiter {self.name}: waiting {wait:.2f}s")
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, cost: float = 1) -> float:
+        # reserve is a blocking Redis call, keep it off the event loop
+        wait = await asyncio.to_thread(self.reserve, cost)
+        if wait > 0:
+            logging.info(f"Rate limiter {self.name}: waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
+        return wait
+
+    def remaining(self) -> float:
+        """Tokens available right now, negative means callers are queued"""
+        try:
+            _, tokens = self.script(
+                keys=[self.key], args=[self.rate, self.capacity, 0]
+            )
+            return float(tokens)
+        except Exception as exc:
+            logging.error(f"Rate limiter {self.name} failed: {exc}")
+            return self.capacity
+
+    def metrics(self) -> dict:
+        remaining = self.remaining()
+        return {
+            "name": self.name,
+            "rate_per_second": self.rate,
+            "capacity": self.capacity,
+            "remaining": max(remaining, 0),
+            "queued_seconds": max(-remaining, 0) / self.rate,
+        }
+
+
+_buckets: dict[str, TokenBucket] = {}
+
+
+def get_bucket(name: str, rate: float, period: float = 60) -> TokenBucket:
+    if name not in _buckets:
+        _buckets[name] = TokenBucket(name, rate=rate, period=period)
+    return _buckets[name]
+
+
+def mohirai_bucket() -> TokenBucket:
+    return get_bucket("mohirai", rate=MOHIRAI_REQUESTS_PER_MINUTE)
+
+
+def openai_bucket(deployment_name: str) -> TokenBucket:
+    return get_bucket(
+        f"openai:{deployment_name}:requests", rate=OPENAI_REQUESTS_PER_MINUTE
+    )
+
+
+def openai_tokens_bucket(deployment_name: str) -> TokenBucket | None:
+    if OPENAI_TOKENS_PER_MINUTE <= 0:
+        return None
+    return get_bucket(
+        f"openai:{deployment_name}:tokens", rate=OPENAI_TOKENS_PER_MINUTE
+    )
+
+
+def estimate_tokens(*texts: str) -> int:
+    # ~4 characters per token, close enough for quota purposes
+    return sum(len(text) for text in texts) // 4 + 1
+
+
+def metrics(deployment_names: t.Iterable[str] = ()) -> list[dict]:
+    mohirai_bucket()
+    for deployment_name in deployment_names:
+        openai_bucket(deployment_name)
+        openai_tokens_bucket(deployment_name)
+
+    return [bucket.metrics() for bucket in _buckets.values()]
@@ -1,5 +1,6 @@
 import re
 import os
+import base64
 import logging  # noqa: F401
 import datetime
 from decouple import config
@@ -78,6 +79,25 @@ def upload_file(bucket, remote_path, local_path):
     return local_path
 
 
+def open_file(bucket, remote_path, chunk_size=1024 * 1024):
+    """Readable file object streaming the blob in `chunk_size` pieces"""
+    client = get_client()
+    bucket = client.get_bucket(bucket)
+    blob: storage.blob.Blob = bucket.blob(remote_path)
+    return blob.open("rb", chunk_size=chunk_size)
+
+
+def get_md5(bucket, remote_path) -> str | None:
+    """Hex md5 of the blob from its metadata, the content is not downloaded"""
+    client = get_client()
+    bucket = client.get_bucket(bucket)
+    blob = bucket.get_blob(remote_path)
+    if blob is None or not blob.md5_hash:
+        # composite uploads only have crc32c
+        return None
+    return base64.b64decode(blob.md5_hash).hex()
+
+
 def delete_file(file_id):
     client = get_client()
     bucket = client.get_bucket(
@@ -1,7 +1,9 @@
 import os
 import json
-import time
+import asyncio
+import hashlib
 import logging
+import typing as t
 
 import openai
 
@@ -9,18 +11,28 @@ from decouple import config
 import openai.error
 
 from backend.core import settings
-from utils.storage import download_file, file_exists
+from utils import rate_limit
+from utils.artifacts import ArtifactCache
+from utils.audio import file_md5
+from utils.storage import download_file, file_exists, get_md5, open_file
+from workers import llm
 from workers.common import celery, PredictTask
 from utils.data_manipulation import (
     convert_to_chat,
+    convert_to_compact_chat,
     process_transcription,
     find_position_from_filename,
     calculate_pause_duration,
     calculate_speech_duration,
-    extract_json_from_markdown,
-    convert_string_to_json,
+    extract_json,
+    JsonStreamExtractor,
+    estimate_tokens,
+    chunk_conversation,
+    merge_checklist_responses,
 )
 import backend.db as db
+from sqlalchemy import Boolean
+from backend.database.models import Result
 from utils.mohirai import mohirAI
 from backend.utils.bitrix import get_deals_by_phone
 from backend.core.dependencies.database import get_db_session
@@ -47,7 +59,8 @@ checklist_prompt = """
         "segment_title 1": ["Question 1", "Question 2"],
         "segment_title 2": ["Question 3", "Question 4"]
     }
-    Here is the list of real segments and their respective questions:
+    The real segments and their respective questions are given in the user message,
+    before the conversation.
 """
 
 courses_list = [
@@ -95,7 +108,108 @@ general_prompt = """
 }
 
 """
-deployment_name: str = config("DEPLOYMENT_NAME", default="gpt4")
+combined_prompt = """
+    You are given a conversation between a call center operator and a customer.
+    Do both of the tasks below and return a single json object in this format:
+    {
+        "general": { response of the general analysis task },
+        "checklist": { response of the checklist task }
+    }
+"""
+
+reduce_prompt = """
+    You are given json analyses of consecutive parts of one conversation between
+    a call center operator and a customer, in the order the parts were spoken.
+    Merge them into a single analysis of the whole conversation: outcomes (e.g.
+    whether the customer agreed to buy) follow the latest parts, summaries and
+    reasons cover the whole call. Return the merged analysis in this format:
+"""
+
+# keys `general_prompt` asks for, combined responses without them are rejected
+GENERAL_RESPONSE_KEYS = (
+    "is_conversation_over",
+    "call_purpose",
+    "sentiment_analysis_of_conversation",
+    "sentiment_analysis_of_operator",
+    "sentiment_analysis_of_customer",
+    "is_customer_satisfied",
+    "is_customer_agreed_to_buy",
+    "is_customer_interested_to_product",
+    "which_course_customer_interested",
+    "summary",
+)
+
+repair_prompt = """
+    You are given a malformed json response and the problems found in it.
+    Return only the corrected json object. Keep every value which is present,
+    use null for missing values and true or false for yes/no questions.
+"""
+
+# Result columns filled by the worker itself, never taken from a model response
+COMPUTED_RESULT_COLUMNS = {
+    "id",
+    "owner_id",
+    "record_id",
+    "checklist_id",
+    "checklist_result",
+    "customer_gender",
+    "operator_answer_delay",
+    "operator_speech_duration",
+    "customer_speech_duration",
+    "created_at",
+    "updated_at",
+    "deleted_at",
+}
+
+deployment_name: str = settings.DEPLOYMENT_NAME
+# stream completions, the json object is taken as soon as it is closed
+LLM_STREAM: bool = config("LLM_STREAM", cast=bool, default=False)
+# split | combined, combined asks for general & checklist in a single request
+LLM_PROMPT_MODE: str = config("LLM_PROMPT_MODE", default="split").lower()
+# verbose | compact, compact uses short speaker tags & one line per speaker turn
+LLM_CONVERSATION_ENCODING: str = config(
+    "LLM_CONVERSATION_ENCODING", default="verbose"
+).lower()
+# conversations longer than this (estimated tokens) are analyzed part by part
+LLM_CHUNK_TOKENS: int = config("LLM_CHUNK_TOKENS", cast=int, default=12000)
+
+# duration, VAD segments, feature vector & gender keyed by storage_id
+audio_artifacts = ArtifactCache(
+    "audio-artifacts",
+    ttl=config("AUDIO_ARTIFACT_CACHE_TTL", cast=int, default=60 * 60 * 24 * 30),
+    max_entries=config("AUDIO_ARTIFACT_CACHE_MAX_ENTRIES", cast=int, default=100_000),
+)
+
+# MohirAI transcripts keyed by owner_id & content hash of the audio, the same
+# recording uploaded again (or pulled from PBX too) is not transcribed twice
+transcripts = ArtifactCache(
+    "transcripts",
+    ttl=config("TRANSCRIPT_CACHE_TTL", cast=int, default=60 * 60 * 24 * 90),
+    max_entries=config("TRANSCRIPT_CACHE_MAX_ENTRIES", cast=int, default=100_000),
+)
+
+# parsed general/checklist responses, see `analysis_key`
+llm_responses = ArtifactCache(
+    "llm-responses",
+    ttl=config("LLM_RESPONSE_CACHE_TTL", cast=int, default=60 * 60 * 24 * 30),
+    max_entries=config("LLM_RESPONSE_CACHE_MAX_ENTRIES", cast=int, default=200_000),
+)
+
+# everything changing the model output for the same transcript, a new prompt
+# text or encoding invalidates cached responses by itself
+PROMPT_VERSION: str = hashlib.sha256(
+    "\n".join(
+        [
+            general_prompt,
+            checklist_prompt,
+            combined_prompt,
+            reduce_prompt,
+            str(courses_list),
+            LLM_CONVERSATION_ENCODING,
+            str(LLM_CHUNK_TOKENS),
+        ]
+    ).encode()
+).hexdigest()[:16]
 
 openai.api_key = config("OPENAI_API_KEY")
 openai.api_base = config("OPENAI_API_BASE")
@@ -103,19 +217,68 @@ openai.api_type = config("OPENAI_API_TYPE")
 openai.api_version = config("OPENAI_API_VERSION")
 
 
-def make_gpt_request(deployment_name: str, prompt: str, text: str) -> str:
-    response = openai.ChatCompletion.create(
+def gpt_messages(prompt: str, text: str) -> list[dict]:
+    return [
+        {
+            "role": "system",
+            "content": prompt,
+        },
+        {"role": "user", "content": text},
+    ]
+
+
+async def make_gpt_request_async(deployment_name: str, prompt: str, text: str) -> str:
+    await rate_limit.openai_bucket(deployment_name).acquire_async()
+    tokens_bucket = rate_limit.openai_tokens_bucket(deployment_name)
+    if tokens_bucket is not None:
+        await tokens_bucket.acquire_async(rate_limit.estimate_tokens(prompt, text))
+
+    if LLM_STREAM:
+        return await stream_gpt_request_async(deployment_name, prompt, text)
+
+    response = await openai.ChatCompletion.acreate(
         deployment_id=deployment_name,
-        messages=[
-            {
-                "role": "system",
-                "content": prompt,
-            },
-            {"role": "user", "content": text},
-        ],
+        messages=gpt_messages(prompt, text),
+        temperature=0.7,
+    )
+    log_token_usage(deployment_name, response)
+    return completion_text(response)
+
+
+async def stream_gpt_request_async(deployment_name: str, prompt: str, text: str):
+    extractor = JsonStreamExtractor()
+    pieces = []
+
+    async for chunk in await openai.ChatCompletion.acreate(
+        deployment_id=deployment_name,
+        messages=gpt_messages(prompt, text),
         temperature=0.7,
+        stream=True,
+    ):
+        choices = chunk.get("choices") or [{}]
+        content = choices[0].get("delta", {}).get("content")
+        if not content:
+            continue
+
+        pieces.append(content)
+        if extractor.feed(content) is not None:
+            # nothing useful comes after the object, stop waiting for it
+            break
+
+    return completion_text({"choices": [{"message": {"content": "".join(pieces)}}]})
+
+
+def log_token_usage(deployment_name: str, response) -> None:
+    usage = response.get("usage") or {}
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    logging.info(
+        f"PERFORMANCE: {deployment_name} prompt_tokens={usage.get('prompt_tokens')} "
+        f"cached_tokens={cached_tokens} "
+        f"completion_tokens={usage.get('completion_tokens')}"
     )
 
+
+def completion_text(response) -> str:
     corrected_text: str = (
         response.get("choices", [{}])[0].get("message", {}).get("content", "")
     )
@@ -129,160 +292,666 @@ def make_gpt_request(deployment_name: str, prompt: str, text: str) -> str:
     return corrected_text
 
 
-def general_checker(
-    text: str, general_prompt: str, courses_list, checklist=None
-) -> str:
-    global deployment_name
+def build_prompt(general_prompt: str, courses_list, checklist=None) -> str:
+    """
+    System prompt, byte identical between calls so provider side prefix caching
+    applies. Anything specific to a call goes to `build_user_message`.
+    """
+    if checklist:
+        return checklist_prompt
+    return general_prompt.replace("[courses_list]", str(courses_list))
 
-    backoff_time: int = 1
 
+def build_user_message(text: str, checklist=None) -> str:
     if checklist:
-        prompt = checklist_prompt + "\n" + json.dumps(checklist)
-    else:
-        prompt = general_prompt.replace("[courses_list]", str(courses_list))
+        return (
+            "Checklist:\n"
+            + json.dumps(checklist, ensure_ascii=False)
+            + "\n\nConversation:\n"
+            + text
+        )
+    return text
 
+
+async def general_checker_async(
+    text: str, general_prompt: str, courses_list, checklist=None
+) -> str:
+    prompt = build_prompt(general_prompt, courses_list, checklist)
     logging.info(f"Making request with {prompt=}")
+    return await prompt_checker_async(build_user_message(text, checklist), prompt)
+
+
+async def prompt_checker_async(text: str, prompt: str) -> str:
+    backoff_time: int = 1
 
     while True:
         try:
-            corrected_text = make_gpt_request(deployment_name, prompt, text)
-            return corrected_text
+            return await make_gpt_request_async(deployment_name, prompt, text)
         except openai.error.RateLimitError as exc:
             logging.info(f"Rate limit exc: {exc=} {backoff_time=}")
-            time.sleep(backoff_time)
+            await asyncio.sleep(backoff_time)
             backoff_time = min(backoff_time * 2, 60)
 
 
-@celery.task(base=PredictTask, track_started=True, name="api", bind=True)
-def api_processing(self: PredictTask, **kwargs):
-    task = kwargs.get("task", {})
-    record = task.get("audio_record", {})
-    checklist_id = task.get("checklist_id", None)
-    general = task.get("general")
-    record_payload = record.get("payload", {})
-    folder_name = task.get("folder_name", "")
-    client_phone_number = task.get("client_phone_number")
-
-    if not task or not record:
-        logging.error("Task data is not provided")
-        raise Exception("Task data is not provided")
-
-    file_path = os.path.join("uploads", record["storage_id"])
+def ensure_local_file(file_path: str, folder_name: str, storage_id: str) -> str:
     if not os.path.exists(file_path):
         bucket = config("STORAGE_BUCKET_NAME", default="dialixai-production")
-        remote_path = f"{folder_name}/{record['storage_id']}"
+        remote_path = f"{folder_name}/{storage_id}"
         if not file_exists(remote_path):
             logging.error(f"File not found in the storage: {remote_path}")
             raise Exception(f"File not found in the storage: {remote_path}")
         download_file(bucket, remote_path, file_path)
 
+    return file_path
+
+
+def open_audio(file_path: str, folder_name: str, storage_id: str) -> t.BinaryIO:
+    """Local copy if there is one, otherwise streamed straight from the bucket"""
+    if os.path.exists(file_path):
+        return open(file_path, "rb")
+
+    bucket = config("STORAGE_BUCKET_NAME", default="dialixai-production")
+    return open_file(bucket, f"{folder_name}/{storage_id}")
+
+
+def get_audio_fingerprint(record: dict, file_path: str, folder_name: str) -> str:
+    """md5 of the audio file, from bucket metadata if there is no local copy"""
+    storage_id = record["storage_id"]
+    fingerprint = (audio_artifacts.get(storage_id) or {}).get("fingerprint")
+    if fingerprint:
+        return fingerprint
+
+    if os.path.exists(file_path):
+        with open(file_path, "rb") as file:
+            fingerprint = file_md5(file)
+    else:
+        bucket = config("STORAGE_BUCKET_NAME", default="dialixai-production")
+        fingerprint = get_md5(bucket, f"{folder_name}/{storage_id}")
+        if fingerprint is None:
+            with open_audio(file_path, folder_name, storage_id) as file:
+                fingerprint = file_md5(file)
+
+    audio_artifacts.update(storage_id, fingerprint=fingerprint)
+    return fingerprint
+
+
+def transcript_key(record: dict, fingerprint: str) -> str:
+    # scoped by owner, transcripts are never shared between accounts
+    return f"{record['owner_id']}:{fingerprint}"
+
+
+def with_cached_transcript(record: dict, file_path: str, folder_name: str) -> dict:
+    """
+    `record` with the transcript of an identical recording of the same owner
+    if there is one, it is stored on the record and costs nothing.
+    """
+    if record.get("payload"):
+        return record
+
+    try:
+        fingerprint = get_audio_fingerprint(record, file_path, folder_name)
+    except Exception as exc:
+        logging.error(f"Failed to fingerprint {record['storage_id']=}: {exc}")
+        return record
+
+    record_payload = transcripts.get(transcript_key(record, fingerprint))
+    if record_payload is None:
+        return record
+
+    logging.info(f"Reusing transcript of {fingerprint=} for {record['id']=}")
+    db.upsert_record(record={**record, "payload": json.dumps(record_payload)})
+    return {**record, "payload": record_payload}
+
+
+def transcribe(record: dict, file_path: str) -> dict:
+    """MohirAI transcription of `file_path`, skipped if the record already has it"""
+    record_payload = record.get("payload", {})
+
     if not record_payload:
         logging.warning("MohirAI payload is not found in the record")
-        record_payload = mohirAI(file_path)
-        amount = record["duration"] * settings.MOHIRAI_PRICE_PER_MS
-        logging.info(f"[TRANSACTION] MohirAI price {amount=}")
-        db.create_transaction(
-            owner_id=record["owner_id"],
-            record_id=record["id"],
-            amount=amount,
-            type="mohirai transcription",
-        )
-        db.upsert_record(record={**record, "payload": json.dumps(record_payload)})
+        record_payload = mohirAI(file_path, duration_ms=record["duration"])
+        save_transcription(record, record_payload)
+
+    return record_payload
+
+
+def save_transcription(record: dict, record_payload: dict) -> None:
+    """Bills the transcription and stores it on the record"""
+    amount = record["duration"] * settings.MOHIRAI_PRICE_PER_MS
+    logging.info(f"[TRANSACTION] MohirAI price {amount=}")
+    db.create_transaction(
+        owner_id=record["owner_id"],
+        record_id=record["id"],
+        amount=amount,
+        type="mohirai transcription",
+    )
+    db.upsert_record(record={**record, "payload": json.dumps(record_payload)})
 
-    # convert conversations
-    conversation = convert_to_chat(record_payload["result"]["offsets"])
+    fingerprint = (audio_artifacts.get(record["storage_id"]) or {}).get("fingerprint")
+    if fingerprint:
+        transcripts.set(transcript_key(record, fingerprint), record_payload)
+
+
+def get_cached_audio_info(record: dict) -> dict | None:
+    # audio derived stuff does not depend on checklist/prompt, reprocessing
+    # a call with cached artifacts and transcript does not touch the audio at all
+    artifacts = audio_artifacts.get(record["storage_id"]) or {}
+    return artifacts.get("gender")
+
+
+def cache_audio_info(record: dict, audio_info: dict) -> None:
+    audio_artifacts.update(
+        record["storage_id"], duration=record["duration"], gender=audio_info
+    )
+
+
+def calculate_conversation_metrics(record_payload: dict, file_path: str) -> dict:
     conversation_with_offset = process_transcription(
         record_payload["result"]["offsets"]
     )
     customer_id, operator_id = find_position_from_filename(file_path)
 
-    # calculations
-    operator_answer_delay = calculate_pause_duration(
-        conversation_with_offset, operator_id, customer_id
+    return {
+        "operator_answer_delay": calculate_pause_duration(
+            conversation_with_offset, operator_id, customer_id
+        ),
+        "operator_speech_duration": calculate_speech_duration(
+            conversation_with_offset, operator_id
+        ),
+        "customer_speech_duration": calculate_speech_duration(
+            conversation_with_offset, customer_id
+        ),
+    }
+
+
+def encode_conversation(offsets: list[dict]) -> str:
+    verbose = convert_to_chat(offsets)
+    compact = convert_to_compact_chat(offsets)
+    logging.info(
+        f"PERFORMANCE: conversation tokens verbose={estimate_tokens(verbose)} "
+        f"compact={estimate_tokens(compact)} ({LLM_CONVERSATION_ENCODING=})"
     )
+    return compact if LLM_CONVERSATION_ENCODING == "compact" else verbose
 
-    operator_speech_duration = calculate_speech_duration(
-        conversation_with_offset, operator_id
+
+def conversation_parts(offsets: list[dict]) -> list[str]:
+    """Whole conversation, or speaker aware chunks of it if it is too long"""
+    conversation = encode_conversation(offsets)
+    if estimate_tokens(conversation) <= LLM_CHUNK_TOKENS:
+        return [conversation]
+
+    parts = chunk_conversation(
+        process_transcription(offsets),
+        LLM_CHUNK_TOKENS,
+        speaker_prefix="S" if LLM_CONVERSATION_ENCODING == "compact" else "Speaker ",
     )
+    logging.info(f"Conversation is split into {len(parts)} parts")
+    return parts
+
 
-    customer_speech_duration = calculate_speech_duration(
-        conversation_with_offset, customer_id
+def part_header(index: int, total: int) -> str:
+    return f"Part {index + 1} of {total} of the conversation:\n"
+
+
+async def general_response_async(parts: list[str]) -> str:
+    if len(parts) == 1:
+        return await general_checker_async(parts[0], general_prompt, courses_list)
+
+    # map: every part is analyzed on its own, all at the same time
+    responses = await asyncio.gather(
+        *[
+            general_checker_async(
+                part_header(index, len(parts)) + part, general_prompt, courses_list
+            )
+            for index, part in enumerate(parts)
+        ]
+    )
+    # reduce: partial analyses (small) are merged into one by the model
+    partials = [extract_json(response) or {} for response in responses]
+    return await prompt_checker_async(
+        json.dumps(partials, ensure_ascii=False),
+        reduce_prompt + "\n" + build_prompt(general_prompt, courses_list),
     )
 
-    # gpt part
-    json_data = {}
-    checklist_response = {}
 
-    if general:
-        gender = self.classify_speaker_gender(file_path, record["title"])
-        gender = gender["result"]["gender"]
-        logging.info(f"Gender detected: {gender}")
-        general_response = general_checker(conversation, general_prompt, courses_list)
-        logging.info(
-            f"[TRANSACTION] General price {record['duration'] * settings.GENERAL_PROMPT_PRICE_PER_MS}"
+async def checklist_response_async(parts: list[str], checklist) -> str | dict:
+    if len(parts) == 1:
+        return await general_checker_async(
+            parts[0], checklist_prompt, courses_list, checklist=checklist
+        )
+
+    responses = await asyncio.gather(
+        *[
+            general_checker_async(
+                part_header(index, len(parts)) + part,
+                checklist_prompt,
+                courses_list,
+                checklist=checklist,
+            )
+            for index, part in enumerate(parts)
+        ]
+    )
+    return merge_checklist_responses(
+        [extract_json(response) or {} for response in responses]
+    )
+
+
+def analysis_key(
+    record: dict, kind: str, offsets: list[dict], checklist=None
+) -> str:
+    transcript_hash = hashlib.sha256(
+        json.dumps(offsets, sort_keys=True, ensure_ascii=False).encode()
+    ).hexdigest()
+    checklist_hash = (
+        hashlib.sha256(json.dumps(checklist, sort_keys=True).encode()).hexdigest()
+        if checklist
+        else "-"
+    )
+    return ":".join(
+        [
+            str(record["owner_id"]),
+            deployment_name,
+            PROMPT_VERSION,
+            kind,
+            checklist_hash[:32],
+            transcript_hash[:32],
+        ]
+    )
+
+
+def get_cached_analysis(key: str | None) -> dict | None:
+    if key is None:
+        return None
+
+    cached = llm_responses.get(key)
+    if cached is None:
+        return None
+
+    # identical inputs were analyzed (and billed) already
+    logging.info(f"LLM response cache hit {key=}")
+    return cached["response"]
+
+
+def cache_analysis(cache_key: str, response: dict, checklist=None) -> None:
+    # incomplete responses are not cached, next run gets another chance
+    if checklist is None:
+        complete = all(key in response for key in GENERAL_RESPONSE_KEYS)
+    else:
+        complete = bool(response) and not checklist_problems(checklist, response)
+
+    if complete:
+        llm_responses.set(cache_key, {"response": response})
+
+
+def analyze_general(record: dict, offsets: list[dict]) -> dict:
+    key = analysis_key(record, "general", offsets)
+    cached = get_cached_analysis(key)
+    if cached is not None:
+        return cached
+
+    parts = conversation_parts(offsets)
+    general_response = llm.submit(general_response_async(parts)).result()
+    json_data = charge_general(record, general_response)
+    cache_analysis(key, json_data)
+    return json_data
+
+
+def charge_general(record: dict, general_response: str | dict) -> dict:
+    """Bills the general prompt and parses its response (if not parsed yet)"""
+    logging.info(
+        f"[TRANSACTION] General price {record['duration'] * settings.GENERAL_PROMPT_PRICE_PER_MS}"
+    )
+    db.create_transaction(
+        owner_id=record["owner_id"],
+        record_id=record["id"],
+        amount=record["duration"] * settings.GENERAL_PROMPT_PRICE_PER_MS,
+        type="general prompt",
+    )
+    return parse_general_response(general_response)
+
+
+def validate_general_response(data: dict) -> tuple[dict, list[str]]:
+    """
+    Keeps the keys which are model filled `Result` columns and checks their
+    types, returns (valid data, problems).
+    """
+    columns = Result.__table__.columns
+    problems = [
+        f"missing key {key}" for key in GENERAL_RESPONSE_KEYS if key not in data
+    ]
+    valid = {}
+
+    for key, value in data.items():
+        if key not in columns or key in COMPUTED_RESULT_COLUMNS:
+            # would fail the insert, not worth a repair request though
+            continue
+        if (
+            value is not None
+            and isinstance(columns[key].type, Boolean)
+            and not isinstance(value, bool)
+        ):
+            problems.append(f"{key} must be true or false")
+            continue
+        valid[key] = value
+
+    return valid, problems
+
+
+def checklist_problems(checklist, data: dict) -> list[str]:
+    # checklist payload is free form json, only the documented shape is checked
+    if not isinstance(checklist, dict):
+        return []
+
+    problems = []
+    for segment, questions in checklist.items():
+        answers = data.get(segment)
+        if not isinstance(answers, dict):
+            problems.append(f"missing segment {segment}")
+            continue
+        if isinstance(questions, list):
+            problems += [
+                f"{segment}: {question} must be true or false"
+                for question in questions
+                if isinstance(question, str)
+                and not isinstance(answers.get(question), bool)
+            ]
+
+    return problems
+
+
+def repair_response(response: str | dict, problems: list[str]) -> dict | None:
+    """Cheap follow up request, only the broken response is sent, not the call"""
+    logging.warning(f"Repairing model response, {problems=}")
+    if isinstance(response, dict):
+        response = json.dumps(response, ensure_ascii=False)
+
+    text = "Problems:\n" + "\n".join(problems) + "\n\nResponse:\n" + response
+    try:
+        repaired = llm.submit(prompt_checker_async(text, repair_prompt)).result()
+    except openai.error.OpenAIError as exc:
+        logging.error(f"Repair request failed: {exc}")
+        return None
+
+    return extract_json(repaired)
+
+
+def parse_general_response(general_response: str | dict) -> dict:
+    data = (
+        general_response
+        if isinstance(general_response, dict)
+        else extract_json(general_response)
+    )
+    valid, problems = validate_general_response(data or {})
+
+    if problems:
+        repaired = repair_response(general_response, problems)
+        if repaired is not None:
+            repaired_valid, repaired_problems = validate_general_response(repaired)
+            if len(repaired_problems) < len(problems):
+                valid, problems = repaired_valid, repaired_problems
+
+    if problems:
+        logging.error(f"General response is still invalid: {problems=}")
+
+    return valid
+
+
+def parse_checklist_response(checklist_response: str | dict, checklist) -> dict:
+    data = (
+        checklist_response
+        if isinstance(checklist_response, dict)
+        else extract_json(checklist_response)
+    )
+    problems = checklist_problems(checklist, data or {})
+    if data is None:
+        problems.insert(0, "response is not a json object")
+
+    if problems:
+        repaired = repair_response(checklist_response, problems)
+        if repaired is not None:
+            repaired_problems = checklist_problems(checklist, repaired)
+            if len(repaired_problems) < len(problems):
+                data, problems = repaired, repaired_problems
+
+    if problems:
+        logging.error(f"Checklist response is still invalid: {problems=}")
+
+    return data or {}
+
+
+def get_checklist_payload(record: dict, checklist_id: str) -> dict | None:
+    checklist = db.get_checklist_by_id(checklist_id, owner_id=str(record["owner_id"]))
+
+    logging.info(f"Checklist from db: {checklist=}")
+
+    if not (checklist and checklist.get("payload")):
+        logging.warning(f"Checklist not found for id: {checklist_id}")
+        return None
+
+    return checklist.get("payload")
+
+
+def analyze_checklist(record: dict, offsets: list[dict], checklist_id: str):
+    checklist = get_checklist_payload(record, checklist_id)
+    if checklist is None:
+        return {}
+
+    key = analysis_key(record, "checklist", offsets, checklist)
+    cached = get_cached_analysis(key)
+    if cached is not None:
+        return cached
+
+    parts = conversation_parts(offsets)
+    checklist_response = llm.submit(
+        checklist_response_async(parts, checklist)
+    ).result()
+    checklist_response = charge_checklist(record, checklist_response, checklist)
+    cache_analysis(key, checklist_response, checklist)
+    return checklist_response
+
+
+def charge_checklist(
+    record: dict, checklist_response: str | dict, checklist=None
+) -> dict:
+    """Bills the checklist prompt and parses its response (if not parsed yet)"""
+    logging.info(
+        f"[TRANSACTION] Checklist price: {record['duration'] * settings.CHECKLIST_PROMPT_PRICE_PER_MS}"
+    )
+    db.create_transaction(
+        owner_id=record["owner_id"],
+        record_id=record["id"],
+        amount=record["duration"] * settings.CHECKLIST_PROMPT_PRICE_PER_MS,
+        type="checklist prompt",
+    )
+    return parse_checklist_response(checklist_response, checklist)
+
+
+def build_combined_prompt(checklist) -> str:
+    return "\n".join(
+        [
+            combined_prompt,
+            "General analysis task:",
+            build_prompt(general_prompt, courses_list),
+            "Checklist task:",
+            build_prompt(checklist_prompt, courses_list, checklist),
+        ]
+    )
+
+
+def parse_combined_response(response: str, checklist) -> tuple[dict, dict] | None:
+    """(general, checklist) parts of a combined response, None if it is invalid"""
+    data = extract_json(response) or {}
+    general_data, checklist_data = data.get("general"), data.get("checklist")
+
+    if not isinstance(general_data, dict) or not isinstance(checklist_data, dict):
+        return None
+
+    general_data, problems = validate_general_response(general_data)
+    if problems or checklist_problems(checklist, checklist_data):
+        return None
+
+    return general_data, checklist_data
+
+
+def analyze_combined(record: dict, conversation: str, checklist) -> tuple | None:
+    """Both prompts in one request, None if the response does not fit the schema"""
+    prompt = build_combined_prompt(checklist)
+    try:
+        response = llm.submit(
+            prompt_checker_async(build_user_message(conversation, checklist), prompt)
+        ).result()
+    except openai.error.OpenAIError as exc:
+        logging.error(f"Combined prompt request failed: {exc}")
+        return None
+
+    parsed = parse_combined_response(response, checklist)
+    if parsed is None:
+        logging.warning(f"Invalid combined response for {record['id']=}: {response=}")
+        return None
+
+    general_data, checklist_data = parsed
+    return charge_general(record, general_data), charge_checklist(
+        record, checklist_data, checklist
+    )
+
+
+def analyze_conversation(
+    record: dict, offsets: list[dict], general: bool, checklist_id: str | None
+) -> tuple[dict, dict | str]:
+    """
+    General and checklist prompts of one call, issued concurrently on the shared
+    LLM loop. Long conversations are analyzed part by part (map-reduce).
+    Returns (general_response, checklist_response).
+    """
+    checklist = get_checklist_payload(record, checklist_id) if checklist_id else None
+
+    general_key = analysis_key(record, "general", offsets) if general else None
+    checklist_key = (
+        analysis_key(record, "checklist", offsets, checklist)
+        if checklist is not None
+        else None
+    )
+    json_data = get_cached_analysis(general_key)
+    checklist_response = get_cached_analysis(checklist_key)
+
+    need_general = general_key is not None and json_data is None
+    need_checklist = checklist_key is not None and checklist_response is None
+    if not (need_general or need_checklist):
+        return json_data or {}, checklist_response or {}
+
+    parts = conversation_parts(offsets)
+
+    combined = LLM_PROMPT_MODE == "combined" and len(parts) == 1
+    if combined and need_general and need_checklist:
+        # conversation is sent (and paid for) once, split mode is the fallback
+        result = analyze_combined(record, parts[0], checklist)
+        if result is not None:
+            cache_analysis(general_key, result[0])
+            cache_analysis(checklist_key, result[1], checklist)
+            return result
+
+    general_future = (
+        llm.submit(general_response_async(parts)) if need_general else None
+    )
+    checklist_future = (
+        llm.submit(checklist_response_async(parts, checklist))
+        if need_checklist
+        else None
+    )
+
+    if general_future is not None:
+        json_data = charge_general(record, general_future.result())
+        cache_analysis(general_key, json_data)
+    if checklist_future is not None:
+        checklist_response = charge_checklist(
+            record, checklist_future.result(), checklist
         )
-        db.create_transaction(
-            owner_id=record["owner_id"],
-            record_id=record["id"],
-            amount=record["duration"] * settings.GENERAL_PROMPT_PRICE_PER_MS,
-            type="general prompt",
+        cache_analysis(checklist_key, checklist_response, checklist)
+
+    return json_data or {}, checklist_response or {}
+
+
+def lookup_crm(record: dict, client_phone_number: str | None) -> dict | None:
+    if not client_phone_number or record.get("bitrix_result") is not None:
+        return None
+
+    db_session = next(get_db_session())
+    bitrix_credentials = get_bitrix_credentials_celery(
+        db_session, owner_id=record["owner_id"]
+    )
+    if not bitrix_credentials:
+        return None
+
+    contact_name, result = get_deals_by_phone(
+        bitrix_credentials.webhook_url, client_phone_number
+    )
+    return {"customer_name": contact_name, "deals": result}
+
+
+# result is handed to the linked `upsert_data` directly, nothing reads it back
+@celery.task(
+    base=PredictTask, track_started=True, name="api", bind=True, ignore_result=True
+)
+def api_processing(self: PredictTask, **kwargs):
+    task = kwargs.get("task", {})
+    record = task.get("audio_record", {})
+    checklist_id = task.get("checklist_id", None)
+    general = task.get("general")
+    folder_name = task.get("folder_name", "")
+    client_phone_number = task.get("client_phone_number")
+
+    if not task or not record:
+        logging.error("Task data is not provided")
+        raise Exception("Task data is not provided")
+
+    file_path = os.path.join("uploads", record["storage_id"])
+    record = with_cached_transcript(record, file_path, folder_name)
+
+    audio_info = get_cached_audio_info(record) if general else None
+
+    if not record.get("payload") or (general and audio_info is None):
+        ensure_local_file(file_path, folder_name, record["storage_id"])
+
+    features_future = None
+
+    if general and audio_info is None:
+        # CPU heavy, runs in the DSP pool while we wait for STT & GPT
+        features_future = self.submit_speaker_features(
+            file_path, record["title"], duration=record["duration"] / 1000
         )
-        json_text = extract_json_from_markdown(general_response)
-        json_data = convert_string_to_json(json_text)
+
+    record_payload = transcribe(record, file_path)
+
+    # gpt part, both prompts are in flight at the same time
+    json_data, checklist_response = analyze_conversation(
+        record, record_payload["result"]["offsets"], general, checklist_id
+    )
+
+    if general:
+        if audio_info is None:
+            audio_info = self.classify_speaker_features(
+                file_path, features_future.result()
+            )
+            cache_audio_info(record, audio_info)
+        else:
+            logging.info(f"Audio artifacts are cached for {record['storage_id']=}")
+        gender = audio_info["result"]["gender"]
+        logging.info(f"Gender detected: {gender}")
         json_data.update(
             {
-                "operator_answer_delay": operator_answer_delay,
-                "operator_speech_duration": operator_speech_duration,
-                "customer_speech_duration": customer_speech_duration,
+                **calculate_conversation_metrics(record_payload, file_path),
                 "customer_gender": gender,
             }
         )
     else:
         logging.info(f"Will not process via general for {file_path=} coz {general=}")
 
-    if checklist_id and checklist_id is not None:
-        checklist = db.get_checklist_by_id(
-            checklist_id, owner_id=str(record["owner_id"])
-        )
-
-        logging.info(f"Checklist from db: {checklist=}")
-
-        if checklist and checklist.get("payload"):
-            checklist_response = general_checker(
-                conversation,
-                checklist_prompt,
-                courses_list,
-                checklist=checklist.get("payload"),
-            )
-            logging.info(
-                f"[TRANSACTION] Checklist price: {record['duration'] * settings.CHECKLIST_PROMPT_PRICE_PER_MS}"
-            )
-            db.create_transaction(
-                owner_id=record["owner_id"],
-                record_id=record["id"],
-                amount=record["duration"] * settings.CHECKLIST_PROMPT_PRICE_PER_MS,
-                type="checklist prompt",
-            )
-        else:
-            logging.warning(f"Checklist not found for id: {checklist_id}")
-            checklist_response = {}
-    else:
+    if not checklist_id:
         logging.info(
             f"Will not process via checklist for {file_path=} coz {checklist_id=}"
         )
 
-    bitrix_result = None
-
-    if client_phone_number and record["bitrix_result"] is None:
-        db_session = next(get_db_session())
-        bitrix_credentials = get_bitrix_credentials_celery(
-            db_session, owner_id=record["owner_id"]
-        )
-        if bitrix_credentials:
-            contact_name, result = get_deals_by_phone(
-                bitrix_credentials.webhook_url, client_phone_number
-            )
-            bitrix_result = {"customer_name": contact_name, "deals": result}
+    bitrix_result = lookup_crm(record, client_phone_number)
 
     return {
         "general_response": json_data,
@@ -0,0 +1,251 @@
+import heapq
+import functools
+import subprocess
+import typing as t
+from collections import deque
+
+import librosa
+import numpy as np
+
+from utils.audio import get_audio_channels
+
+# silero vad only supports 8k/16k
+VAD_SAMPLING_RATE: int = 16000
+# librosa's default, gender model was trained on features extracted at this rate
+FEATURE_SAMPLING_RATE: int = 22050
+# silero v5 works on fixed 512 sample windows at 16k (32ms)
+VAD_WINDOW_SIZE: int = 512
+# librosa.feature.melspectrogram defaults, gender model expects 128 mel bands
+N_FFT: int = 2048
+HOP_LENGTH: int = 512
+N_MELS: int = 128
+
+
+def decode_audio(file_path: str, sample_rate: int = FEATURE_SAMPLING_RATE):
+    """
+    Decodes `file_path` exactly once, all channels are kept.
+    Returns (samples, sample_rate), samples shape is (channels, n) or (n,) for mono
+    """
+    return librosa.load(file_path, sr=sample_rate, mono=False)
+
+
+def select_channel(y: np.ndarray, channel: int) -> np.ndarray:
+    if y.ndim == 1:
+        return y
+
+    if channel >= y.shape[0]:
+        # unexpected layout, fallback to the whole mix
+        return librosa.to_mono(y)
+
+    return y[channel]
+
+
+def resample(y: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    if orig_sr == target_sr:
+        return y
+    return librosa.resample(y, orig_sr=orig_sr, target_sr=target_sr)
+
+
+def rescale_timestamps(timestamps: list[dict], orig_sr: int, target_sr: int):
+    ratio = target_sr / orig_sr
+    return [
+        {"start": int(item["start"] * ratio), "end": int(item["end"] * ratio)}
+        for item in timestamps
+    ]
+
+
+def seconds_timestamps(timestamps: list[dict], sample_rate: int) -> list[dict]:
+    return [
+        {
+            "start": round(item["start"] / sample_rate, 3),
+            "end": round(item["end"] / sample_rate, 3),
+        }
+        for item in timestamps
+    ]
+
+
+def longest_segments(ranges: t.Iterable[dict], k: int) -> list[dict]:
+    """Top `k` VAD ranges by duration in O(n log k), returned in chronological order"""
+    top = heapq.nlargest(k, ranges, key=lambda item: item["end"] - item["start"])
+    return sorted(top, key=lambda item: item["start"])
+
+
+@functools.lru_cache(maxsize=8)
+def mel_filterbank(sample_rate: int, n_fft: int = N_FFT, n_mels: int = N_MELS):
+    return librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels)
+
+
+@functools.lru_cache(maxsize=8)
+def stft_window(n_fft: int = N_FFT):
+    return librosa.filters.get_window("hann", n_fft, fftbins=True)
+
+
+def mel_features(X: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Equals `np.mean(librosa.feature.melspectrogram(y=X, sr=sample_rate).T, axis=0)`,
+    but filterbank & window are built once per process instead of on every call.
+    """
+    stft = librosa.stft(X, n_fft=N_FFT, hop_length=HOP_LENGTH, window=stft_window())
+    spectrum = np.abs(stft) ** 2
+    return np.mean(mel_filterbank(sample_rate) @ spectrum, axis=1)
+
+
+def extract_features(X: np.ndarray, sample_rate: int, **kwargs) -> np.ndarray:
+    """
+    Extract feature from already decoded audio `X`
+        Features supported:
+            - MFCC (mfcc)
+            - Chroma (chroma)
+            - MEL Spectrogram Frequency (mel)
+            - Contrast (contrast)
+            - Tonnetz (tonnetz)
+        e.g:
+        `features = extract_features(X, sample_rate, mel=True, mfcc=True)`
+    """
+    mfcc = kwargs.get("mfcc")
+    chroma = kwargs.get("chroma")
+    mel = kwargs.get("mel")
+    contrast = kwargs.get("contrast")
+    tonnetz = kwargs.get("tonnetz")
+    if chroma or contrast:
+        stft = np.abs(librosa.stft(X))
+    result = np.array([])
+    if mfcc:
+        mfccs = np.mean(librosa.feature.mfcc(y=X, sr=sample_rate, n_mfcc=40).T, axis=0)
+        result = np.hstack((result, mfccs))
+    if chroma:
+        chroma = np.mean(librosa.feature.chroma_stft(S=stft, sr=sample_rate).T, axis=0)
+        result = np.hstack((result, chroma))
+    if mel:
+        result = np.hstack((result, mel_features(X, sample_rate)))
+    if contrast:
+        contrast = np.mean(
+            librosa.feature.spectral_contrast(S=stft, sr=sample_rate).T, axis=0
+        )
+        result = np.hstack((result, contrast))
+    if tonnetz:
+        tonnetz = np.mean(
+            librosa.feature.tonnetz(y=librosa.effects.harmonic(X), sr=sample_rate).T,
+            axis=0,
+        )
+        result = np.hstack((result, tonnetz))
+    return result
+
+
+def speech_features(speech: np.ndarray) -> np.ndarray:
+    """
+    Gender model input for `VAD_SAMPLING_RATE` speech. The model was trained on
+    VAD output re-read at `FEATURE_SAMPLING_RATE`, so speech is upsampled the
+    same way and has no content above 8 kHz, whatever the source rate was.
+    """
+    return extract_features(
+        resample(speech, VAD_SAMPLING_RATE, FEATURE_SAMPLING_RATE),
+        FEATURE_SAMPLING_RATE,
+        mel=True,
+    )
+
+
+def stream_audio_windows(
+    file_path: str,
+    channel: int,
+    sample_rate: int = VAD_SAMPLING_RATE,
+    window_size: int = VAD_WINDOW_SIZE,
+) -> t.Iterator[np.ndarray]:
+    """
+    Decodes `channel` of `file_path` with ffmpeg and yields fixed size float32
+    windows while decoding is still in progress, memory does not depend on length.
+    """
+    channels = get_audio_channels(file_path) or 1
+
+    command = ["ffmpeg", "-v", "error", "-nostdin", "-i", file_path]
+    if channels > 1:
+        channel = channel if channel < channels else 0
+        command += ["-af", f"pan=mono|c0=c{channel}"]
+    command += ["-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "pipe:1"]
+
+    window_bytes = window_size * 4  # float32
+    process = subprocess.Popen(
+        command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+    try:
+        while True:
+            data = process.stdout.read(window_bytes)
+            if not data:
+                break
+
+            window = np.frombuffer(data, dtype=np.float32)
+            if len(window) < window_size:
+                # silero requires full windows, pad the tail with silence
+                window = np.pad(window, (0, window_size - len(window)))
+
+            yield window
+
+        if process.wait() != 0:
+            raise RuntimeError(
+                f"ffmpeg failed on {file_path}: {process.stderr.read().decode()}"
+            )
+    finally:
+        # consumer may stop early, do not leave ffmpeg running
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def stream_speech_segments(
+    windows: t.Iterable[np.ndarray],
+    vad_iterator: t.Callable,
+    sample_rate: int = VAD_SAMPLING_RATE,
+    max_segment_seconds: float = 60.0,
+    history_windows: int = 8,
+) -> t.Iterator[dict]:
+    """
+    Runs silero's `VADIterator` over decoder `windows` and yields speech segments
+    ({"start", "end", "audio"}, samples at `sample_rate`) as soon as each one ends.
+    Only the currently open segment is buffered (capped by `max_segment_seconds`).
+    """
+    import torch
+
+    max_segment_samples = int(max_segment_seconds * sample_rate)
+    # VADIterator pads starts backwards, keep a few past windows to cut from
+    history: deque[tuple[int, np.ndarray]] = deque(maxlen=history_windows)
+    buffer: list[tuple[int, np.ndarray]] = []
+    segment_start: int | None = None
+    offset = 0
+
+    def cut(start: int, end: int) -> dict:
+        buffer_offset = buffer[0][0]
+        audio = np.concatenate([window for _, window in buffer])
+        return {
+            "start": start,
+            "end": end,
+            "audio": audio[max(start - buffer_offset, 0) : end - buffer_offset],
+        }
+
+    for window in windows:
+        event = vad_iterator(torch.from_numpy(np.array(window)))
+        window_end = offset + len(window)
+
+        if segment_start is None and event and "start" in event:
+            segment_start = event["start"]
+            buffer = list(history)
+
+        if segment_start is not None:
+            buffer.append((offset, window))
+
+            if event and "end" in event:
+                yield cut(segment_start, min(event["end"], window_end))
+                segment_start, buffer = None, []
+            elif window_end - segment_start >= max_segment_samples:
+                yield cut(segment_start, window_end)
+                segment_start, buffer = window_end, []
+
+        history.append((offset, window))
+        offset = window_end
+
+    if segment_start is not None and buffer:
+        yield cut(segment_start, offset)
+
+    vad_iterator.reset_states()
@@ -0,0 +1,142 @@
+import time
+import queue
+import logging
+import threading
+import typing as t
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BatchMetrics:
+    """Per-batch latency & size metrics of a batcher"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        self.last_size = 0
+        self.max_size = 0
+
+    def record(self, size: int, latency: float):
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            self.total_latency += latency
+            self.last_latency = latency
+            self.last_size = size
+            self.max_size = max(self.max_size, size)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": self.items / self.batches if self.batches else 0,
+                "max_batch_size": self.max_size,
+                "last_batch_size": self.last_size,
+                "avg_batch_latency": (
+                    self.total_latency / self.batches if self.batches else 0
+                ),
+                "last_batch_latency": self.last_latency,
+            }
+
+
+class FeatureBatcher:
+    """
+    Collects feature vectors from concurrent callers (in-flight calls) and scores
+    them with one vectorized forward pass of `predict_fn`.
+
+    A batch is flushed once `max_batch_size` vectors are queued or `max_wait`
+    seconds passed since the first vector of the batch arrived.
+    `predict_fn` takes (batch_size, vector_length) array and returns (batch_size,)
+
+    With `inline` set vectors are scored on the caller's thread right away, for
+    pools that never have concurrent callers (prefork children).
+    """
+
+    def __init__(
+        self,
+        predict_fn: t.Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait: float = 0.05,
+        name: str = "batcher",
+        inline: bool = False,
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+        self.inline = inline
+        self.metrics = BatchMetrics()
+
+        self._queue: queue.Queue[tuple[np.ndarray, Future]] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, features: np.ndarray) -> Future:
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((np.asarray(features, dtype=np.float32).reshape(-1), future))
+        return future
+
+    def predict(self, features: np.ndarray, timeout: float | None = None) -> float:
+        if self.inline:
+            batch = np.asarray(features, dtype=np.float32).reshape(1, -1)
+            return self._run(batch)[0]
+
+        return self.submit(features).result(timeout=timeout)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        with self._thread_lock:
+            # forked workers inherit a dead thread object, so check liveness
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name=f"{self.name}-flusher", daemon=True
+                )
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(items) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            batch = np.stack([features for features, _ in items])
+
+            try:
+                outputs = self._run(batch)
+            except Exception as exc:
+                for _, future in items:
+                    future.set_exception(exc)
+                continue
+
+            for (_, future), output in zip(items, outputs):
+                future.set_result(output)
+
+    def _run(self, batch: np.ndarray) -> list[float]:
+        start = time.perf_counter()
+        outputs = np.asarray(self.predict_fn(batch)).reshape(-1)
+        latency = time.perf_counter() - start
+
+        self.metrics.record(len(batch), latency)
+        logger.info(
+            f"PERFORMANCE: {self.name} batch of {len(batch)} took {latency:.4f}s, "
+            f"so far {self.metrics.snapshot()}"
+        )
+        return [float(output) for output in outputs]
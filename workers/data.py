@@ -1,13 +1,38 @@
 import os
 import json
-import asyncio
 import logging  # noqa: F401
+import typing as t
 
-from workers.common import celery, PredictTask
+from decouple import config
+
+from workers.common import celery
 import backend.db as db
 from celery.result import AsyncResult
 
-from backend.sockets import redis_manager
+from utils.encoder import Encoder
+from utils.notifications import notifier
+from utils.redis_utils import redis_client
+from utils.data_manipulation import extract_json
+
+# immediate | batched
+DATA_PERSISTENCE_MODE: str = config(
+    "DATA_PERSISTENCE_MODE", default="immediate"
+).lower()
+# finished tasks written by one flush transaction at most
+DATA_BATCH_SIZE: int = config("DATA_BATCH_SIZE", cast=int, default=200)
+# seconds a finished task may wait for the rest of its batch
+DATA_BATCH_MAX_WAIT: float = config("DATA_BATCH_MAX_WAIT", cast=float, default=1.0)
+# flushes a task may fail before it is parked in FAILED_RESULTS_KEY
+DATA_FLUSH_MAX_ATTEMPTS: int = config("DATA_FLUSH_MAX_ATTEMPTS", cast=int, default=5)
+# seconds one batch may take before another flush takes over its items
+DATA_FLUSH_LOCK_TIMEOUT: int = config("DATA_FLUSH_LOCK_TIMEOUT", cast=int, default=300)
+
+PENDING_RESULTS_KEY: str = "data:pending"
+# batch being persisted, left over only if its flush died before committing
+PROCESSING_RESULTS_KEY: str = "data:processing"
+FAILED_RESULTS_KEY: str = "data:failed"
+FLUSH_SCHEDULED_KEY: str = "data:flush-scheduled"
+FLUSH_LOCK_KEY: str = "data:flush-lock"
 
 keys_of_interest = [
     "operator_answer_delay",
@@ -26,108 +51,277 @@ keys_of_interest = [
 ]
 
 
-@celery.task(base=PredictTask, track_started=True, bind=True, acks_late=True)
-def upsert_data(self: PredictTask, *args, **kwargs):
-    task = kwargs["task"]
-    task_id = task["task_id"]
-    result_id = task_id.split("/")[-1]
+def get_task_result(task: dict, parent_result: t.Any = None) -> dict | None:
+    """
+    Output of the processing task, None if it failed. Linked callbacks get it
+    as their first argument, the result backend is only asked for callbacks
+    queued before it was passed along.
+    """
+    if not task["is_success"]:
+        return None
+
+    if isinstance(parent_result, dict):
+        return parent_result
+
+    result = AsyncResult(str(task["task_id"]), app=celery)
+    if result and str(result.status) == "SUCCESS":
+        return result.result
+    return None
+
+
+def build_update(
+    task: dict,
+    task_result: dict | None,
+    existing_record: dict,
+    existing_result: dict | None,
+) -> dict:
+    """
+    What a finished task changes: new record `status` (+ `bitrix_result`),
+    `result` row to upsert (None on failure) and the socket `event`.
+    """
+    result_id = task["task_id"].split("/")[-1]
     record_id = task["record_id"]
-    owner_id = task["owner_id"]
-    is_success = task["is_success"]
-    storage_id = task["storage_id"]
+    checklist_id = task.get("checklist_id", None) or (
+        existing_result.get("checklist_id", None) if existing_result else None
+    )
 
-    file_path = os.path.join("uploads", storage_id)
+    if task_result is None:
+        return {
+            "status": "FAILED",
+            "result": None,
+            "event": {
+                "record_id": record_id,
+                "result_id": result_id,
+                "checklist_id": checklist_id,
+                "status": "FAILED",
+            },
+        }
 
-    loop = asyncio.get_event_loop()
+    general_data = {
+        key: existing_result[key]
+        for key in keys_of_interest
+        if existing_result and key in existing_result
+    }
 
-    existing_record = db.get_record_by_id(record_id, owner_id)
-    existing_result = db.get_result_by_record_id_v1(record_id, owner_id)
-    existing_result_id = existing_result.get("id", None) if existing_result else None
-    task_checklist_id = task.get("checklist_id", None)
-    checklist_id = (
-        task_checklist_id
-        if task_checklist_id
-        else (existing_result.get("checklist_id", None) if existing_result else None)
+    existing_checklist_response = (
+        existing_result.get("checklist_result", {}) if existing_result else {}
+    )
+    general_response = task_result.get("general_response", general_data)
+    checklist_response = (
+        task_result.get("checklist_response")
+        if task_result.get("checklist_response", None)
+        else existing_checklist_response
     )
 
-    task = AsyncResult(str(task_id), app=celery)
-    task_status = str(task.status)
+    if isinstance(checklist_response, str):
+        checklist_response = extract_json(checklist_response) or {}
 
-    if task and is_success and task_status == "SUCCESS":
-        task_result = task.result
-        general_data = {
-            key: existing_result[key]
-            for key in keys_of_interest
-            if existing_result and key in existing_result
-        }
+    return {
+        "status": "COMPLETED",
+        "bitrix_result": json.dumps(task_result.get("bitrix_result")),
+        "result": {
+            "id": str(existing_result["id"] if existing_result else result_id),
+            "owner_id": task["owner_id"],
+            "record_id": record_id,
+            "checklist_id": checklist_id,
+            "checklist_result": checklist_response,
+            **general_response,
+        },
+        "event": {
+            "record_id": record_id,
+            "result_id": result_id,
+            "checklist_id": checklist_id,
+            "checklist_result": checklist_response,
+            **general_response,
+        },
+    }
 
-        existing_checklist_response = (
-            existing_result.get("checklist_result", {}) if existing_result else {}
-        )
-        general_response = task_result.get("general_response", general_data)
-        checklist_response = (
-            task_result.get("checklist_response")
-            if task_result.get("checklist_response", None)
-            else existing_checklist_response
-        )
 
-        db.upsert_record(
-            record={
-                **existing_record,
-                "status": "COMPLETED",
-                "bitrix_result": json.dumps(task_result.get("bitrix_result")),
-            }
+def emit_result_events(events: list[tuple[str, dict]]) -> None:
+    """Sends `result` events, (owner id, data) each, to the owners' socket rooms"""
+    try:
+        notifier.emit_many(
+            ("result", {"data": data}, f"user/{owner_id}") for owner_id, data in events
         )
+    except Exception as exc:
+        # data is already committed, a lost notification must not redo it
+        logging.error(f"Failed to emit {len(events)} result events: {exc}")
 
-        if isinstance(checklist_response, str):
-            checklist_response = json.loads(
-                checklist_response.strip("`").strip("json").strip("\n")
-            )
 
-        db.upsert_result(
-            result={
-                "id": str(existing_result_id if existing_result_id else result_id),
-                "owner_id": owner_id,
-                "record_id": record_id,
-                "checklist_id": checklist_id,
-                "checklist_result": checklist_response,
-                **general_response,
-            }
-        )
+def persist_result(task: dict, task_result: dict | None) -> None:
+    record_id, owner_id = task["record_id"], task["owner_id"]
+
+    existing_record = db.get_record_by_id(record_id, owner_id)
+    existing_result = db.get_result_by_record_id_v1(record_id, owner_id)
+    update = build_update(task, task_result, existing_record, existing_result)
+
+    record = {**existing_record, "status": update["status"]}
+    if "bitrix_result" in update:
+        record["bitrix_result"] = update["bitrix_result"]
+
+    db.upsert_record(record=record)
+    if update["result"] is not None:
+        db.upsert_result(result=update["result"])
+
+    emit_result_events([(owner_id, update["event"])])
+
+
+def schedule_flush() -> None:
+    # expires in case the scheduled flush gets lost
+    if redis_client.set(
+        FLUSH_SCHEDULED_KEY, 1, nx=True, ex=int(DATA_BATCH_MAX_WAIT) + 60
+    ):
+        flush_results.apply_async(countdown=DATA_BATCH_MAX_WAIT, queue="data")
+
 
-        loop.run_until_complete(
-            redis_manager.emit(
-                "result",
-                {
-                    "data": {
-                        "record_id": record_id,
-                        "result_id": result_id,
-                        "checklist_id": checklist_id,
-                        "checklist_result": checklist_response,
-                        **general_response,
-                    }
-                },
-                room=f"user/{owner_id}",
+def queue_result(task: dict, task_result: dict | None) -> None:
+    """Leaves the task to the next `flush_results`, scheduling it if needed"""
+    item = json.dumps({"task": task, "result": task_result}, cls=Encoder)
+    redis_client.rpush(PENDING_RESULTS_KEY, item)
+    schedule_flush()
+
+
+def pop_results(size: int) -> list[dict]:
+    """
+    Next batch, moved to PROCESSING_RESULTS_KEY until `ack_results`. A batch
+    left there by a dead flush is handed out again first.
+    """
+    items = redis_client.lrange(PROCESSING_RESULTS_KEY, 0, -1)
+    if not items:
+        with redis_client.pipeline() as pipeline:
+            for _ in range(size):
+                pipeline.lmove(PENDING_RESULTS_KEY, PROCESSING_RESULTS_KEY)
+            items = [item for item in pipeline.execute() if item is not None]
+
+    return [json.loads(item) for item in items]
+
+
+def ack_results(retry: list[dict]) -> None:
+    """Drops the persisted batch, its failed items go back to the queue"""
+    retry = [{**item, "attempts": item.get("attempts", 0) + 1} for item in retry]
+    failed = [item for item in retry if item["attempts"] >= DATA_FLUSH_MAX_ATTEMPTS]
+    retry = [item for item in retry if item["attempts"] < DATA_FLUSH_MAX_ATTEMPTS]
+
+    with redis_client.pipeline() as pipeline:
+        for key, items in ((PENDING_RESULTS_KEY, retry), (FAILED_RESULTS_KEY, failed)):
+            if items:
+                pipeline.rpush(key, *(json.dumps(item, cls=Encoder) for item in items))
+        pipeline.delete(PROCESSING_RESULTS_KEY)
+        pipeline.execute()
+
+    for item in failed:
+        task_id = item["task"]["task_id"]
+        logging.error(f"Giving up on {task_id=}, kept in {FAILED_RESULTS_KEY}")
+
+
+def fill_missing_keys(results: list[dict], existing_results: dict) -> list[dict]:
+    """
+    Multi-row upsert needs the same columns in every row, columns a task did not
+    produce keep their current value, same as a single row upsert leaves them.
+    """
+    keys = list(dict.fromkeys(key for result in results for key in result))
+    return [
+        {
+            key: (
+                result[key]
+                if key in result
+                else (existing_results.get(result["record_id"]) or {}).get(key)
             )
+            for key in keys
+        }
+        for result in results
+    ]
+
+
+def persist_batch(items: list[dict]) -> None:
+    # the latest finished task of a record wins, as with one upsert per task
+    latest = {str(item["task"]["record_id"]): item for item in items}
+    existing_records, existing_results = db.get_records_and_results_by_ids(
+        list(latest)
+    )
+
+    completed, failed, results, events = [], [], [], []
+    for record_id, item in latest.items():
+        task = item["task"]
+        existing_record = existing_records.get(record_id)
+        if existing_record is None or str(existing_record["owner_id"]) != str(
+            task["owner_id"]
+        ):
+            logging.warning(f"Dropping result of unknown {record_id=}")
+            continue
+
+        update = build_update(
+            task, item["result"], existing_record, existing_results.get(record_id)
         )
+        if update["result"] is None:
+            failed.append(record_id)
+        else:
+            completed.append((record_id, update["bitrix_result"]))
+            results.append(update["result"])
+        events.append((task["owner_id"], update["event"]))
+
+    db.upsert_results_batch(
+        completed, failed, fill_missing_keys(results, existing_results)
+    )
+    # only committed results are announced
+    emit_result_events(events)
+
+
+@celery.task(name="data.flush_results", ignore_result=True)
+def flush_results():
+    # tasks queued from now on schedule the next flush
+    redis_client.delete(FLUSH_SCHEDULED_KEY)
+
+    lock = redis_client.lock(FLUSH_LOCK_KEY, timeout=DATA_FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        # the running flush may miss tasks queued after its last batch
+        schedule_flush()
+        return
+
+    retried = False
+    try:
+        while items := pop_results(DATA_BATCH_SIZE):
+            logging.info(f"Persisting batch of {len(items)} results")
+            retry = []
+            try:
+                persist_batch(items)
+            except Exception as exc:
+                logging.error(f"Batch persisting failed, one by one instead: {exc}")
+                for item in items:
+                    try:
+                        persist_result(item["task"], item["result"])
+                    except Exception as exc:
+                        task_id = item["task"]["task_id"]
+                        logging.error(f"Persisting {task_id=} failed: {exc}")
+                        retry.append(item)
+
+            ack_results(retry)
+            lock.reacquire()
+            if retry:
+                retried = True
+                # retried by the next flush, not right away by this one
+                break
+    finally:
+        lock.release()
+
+    if retried:
+        schedule_flush()
+
 
+@celery.task(track_started=True, bind=True, acks_late=True, ignore_result=True)
+def upsert_data(self, *args, **kwargs):
+    task = kwargs["task"]
+    storage_id = task["storage_id"]
+
+    file_path = os.path.join("uploads", storage_id)
+
+    # linked as callback, args[0] is what the processing task returned
+    task_result = get_task_result(task, args[0] if args else None)
+
+    if DATA_PERSISTENCE_MODE == "batched":
+        queue_result(task, task_result)
     else:
-        db.upsert_record(record={**existing_record, "status": "FAILED"})
-
-        loop.run_until_complete(
-            redis_manager.emit(
-                "result",
-                {
-                    "data": {
-                        "record_id": record_id,
-                        "result_id": result_id,
-                        "checklist_id": checklist_id,
-                        "status": "FAILED",
-                    }
-                },
-                room=f"user/{owner_id}",
-            )
-        )
+        persist_result(task, task_result)
 
     if os.path.exists(file_path):
         os.remove(file_path)
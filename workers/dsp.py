@@ -0,0 +1,96 @@
+"""
+Process pool for CPU heavy audio work (decode, VAD, STFT/mel).
+Celery task threads submit to it and keep doing network bound stages meanwhile.
+"""
+
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from decouple import config
+
+# 0 disables the pool, work then runs inline on the calling thread
+DSP_POOL_WORKERS: int = config(
+    "DSP_POOL_WORKERS", cast=int, default=max((os.cpu_count() or 2) - 1, 1)
+)
+# recycle children from time to time, librosa/numba caches only grow
+DSP_POOL_MAX_TASKS_PER_CHILD: int = config(
+    "DSP_POOL_MAX_TASKS_PER_CHILD", cast=int, default=200
+)
+
+# intra-op threads of every child, children already use all the cores between them
+DSP_CHILD_THREADS: int = config("DSP_CHILD_THREADS", cast=int, default=1)
+
+_pool: ProcessPoolExecutor | None = None
+_pool_pid: int | None = None
+_lock = threading.Lock()
+
+
+def init_child(threads: int) -> None:
+    """Pool initializer, keeps each child at `threads` compute threads"""
+    for name in (
+        "OMP_NUM_THREADS",
+        "MKL_NUM_THREADS",
+        "OPENBLAS_NUM_THREADS",
+        "NUMBA_NUM_THREADS",
+    ):
+        os.environ[name] = str(threads)
+
+    try:
+        import torch
+    except ImportError:
+        return
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(threads)
+    except RuntimeError:
+        # only allowed before the first parallel work, fine if already set
+        pass
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+
+    # celery prefork children must not reuse a pool created by their parent
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            logging.info(f"Starting DSP pool with {DSP_POOL_WORKERS} workers")
+            _pool = ProcessPoolExecutor(
+                max_workers=DSP_POOL_WORKERS,
+                # spawn, forking a process with torch/tf threads is not safe
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=DSP_POOL_MAX_TASKS_PER_CHILD,
+                initializer=init_child,
+                initargs=(DSP_CHILD_THREADS,),
+            )
+            _pool_pid = os.getpid()
+
+        return _pool
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    """`fn` must be a module level (picklable) function"""
+    if DSP_POOL_WORKERS <= 0:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    return get_pool().submit(fn, *args, **kwargs)
+
+
+def shutdown(wait: bool = True):
+    global _pool, _pool_pid
+
+    with _lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool, _pool_pid = None, None
@@ -0,0 +1,60 @@
+"""
+Async OpenAI transport. One event loop thread per worker process owns a shared
+aiohttp session, every prompt of a call (and of concurrently running calls)
+goes over the same connection pool and is in flight at the same time.
+"""
+
+import os
+import asyncio
+import logging
+import threading
+import typing as t
+from concurrent.futures import Future
+
+import aiohttp
+import openai
+from decouple import config
+
+LLM_MAX_CONNECTIONS: int = config("LLM_MAX_CONNECTIONS", cast=int, default=100)
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_pid: int | None = None
+_session: aiohttp.ClientSession | None = None
+_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _loop_pid, _session
+
+    # forked children must not reuse the parent's loop, its thread is not there
+    if _loop is not None and _loop_pid == os.getpid():
+        return _loop
+
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid():
+            logging.info("Starting LLM event loop")
+            _loop, _session = asyncio.new_event_loop(), None
+            threading.Thread(
+                target=_loop.run_forever, name="llm-loop", daemon=True
+            ).start()
+            _loop_pid = os.getpid()
+
+        return _loop
+
+
+async def _with_session(coro: t.Awaitable):
+    global _session
+
+    # only ever touched from the loop thread, no locking needed
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=LLM_MAX_CONNECTIONS)
+        )
+
+    openai.aiosession.set(_session)
+    return await coro
+
+
+def submit(coro: t.Awaitable) -> Future:
+    """Schedules `coro` on the LLM loop, callable from any thread"""
+    return asyncio.run_coroutine_threadsafe(_with_session(coro), get_loop())
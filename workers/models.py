@@ -0,0 +1,156 @@
+import os
+import logging
+import threading
+import typing as t
+
+import numpy as np
+from decouple import config
+
+SILERO_VAD_DIR: str = config("SILERO_VAD_DIR", default="./models/silero-vad")
+TORCH_HUB_DIR: str = config("TORCH_HUB_DIR", default="")
+TORCH_FORCE_RELOAD: bool = config("TORCH_FORCE_RELOAD", cast=bool, default=False)
+MODEL_PATH: str = config("MODEL_PATH", default="./models/model.h5")
+GENDER_ONNX_MODEL_PATH: str = config(
+    "GENDER_ONNX_MODEL_PATH", default="./models/model.onnx"
+)
+# keras | onnx, onnx runs both VAD and gender model on onnxruntime (CPU)
+INFERENCE_BACKEND: str = config("INFERENCE_BACKEND", default="keras").lower()
+ONNX_INTRA_OP_THREADS: int = config("ONNX_INTRA_OP_THREADS", cast=int, default=1)
+
+
+def create_gender_model(vector_length=128):
+    """5 hidden dense layers from 256 units to 64, not the best model, but not bad."""
+    # tensorflow is imported here, so only processes using the model pay for it
+    from tensorflow.keras import Sequential
+    from tensorflow.keras.layers import Dense, Dropout
+
+    model = Sequential()
+    model.add(Dense(256, input_shape=(vector_length,)))
+    model.add(Dropout(0.3))
+    model.add(Dense(256, activation="relu"))
+    model.add(Dropout(0.3))
+    model.add(Dense(128, activation="relu"))
+    model.add(Dropout(0.3))
+    model.add(Dense(128, activation="relu"))
+    model.add(Dropout(0.3))
+    model.add(Dense(64, activation="relu"))
+    model.add(Dropout(0.3))
+    # one output neuron with sigmoid activation function, 0 means female, 1 means male
+    model.add(Dense(1, activation="sigmoid"))
+    # using binary crossentropy as it's male/female classification (binary)
+    model.compile(loss="binary_crossentropy", metrics=["accuracy"], optimizer="adam")
+    # print summary of the model
+    model.summary()
+    return model
+
+
+class OnnxGenderModel:
+    """
+    Exported copy of the gender model (see scripts/export_gender_onnx.py),
+    mirrors the part of keras' Model interface used by the workers.
+    """
+
+    def __init__(self, model_path: str = GENDER_ONNX_MODEL_PATH):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+        self.session = onnxruntime.InferenceSession(
+            model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict_on_batch(self, batch):
+        (outputs,) = self.session.run(
+            None, {self.input_name: np.asarray(batch, dtype=np.float32)}
+        )
+        return outputs
+
+    predict = predict_on_batch
+
+
+def load_silero_vad(onnx: bool = INFERENCE_BACKEND == "onnx"):
+    import torch
+
+    if TORCH_HUB_DIR:
+        torch.hub.set_dir(TORCH_HUB_DIR)
+
+    if os.path.isdir(SILERO_VAD_DIR):
+        # vendored copy of the repo, no network access needed
+        return torch.hub.load(
+            repo_or_dir=SILERO_VAD_DIR,
+            model="silero_vad",
+            source="local",
+            onnx=onnx,
+        )
+
+    # falls back to torch hub's on-disk cache, only downloads on the first run
+    return torch.hub.load(
+        repo_or_dir="snakers4/silero-vad",
+        model="silero_vad",
+        force_reload=TORCH_FORCE_RELOAD,
+        trust_repo=True,
+        onnx=onnx,
+    )
+
+
+def load_gender_model(
+    backend: str = INFERENCE_BACKEND, model_path: t.Optional[str] = None
+):
+    if model_path is None:
+        model_path = GENDER_ONNX_MODEL_PATH if backend == "onnx" else MODEL_PATH
+
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"No such file or directory: '{model_path}'")
+
+    if backend == "onnx":
+        return OnnxGenderModel(model_path)
+
+    model = create_gender_model()
+    model.load_weights(model_path)
+    return model
+
+
+class ModelRegistry:
+    """
+    Lazily loads heavy models, at most once per worker process.
+    Tasks which never touch audio never load (or even import) torch/tensorflow.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._models: dict[str, t.Any] = {}
+        self._loaders: dict[str, t.Callable[[], t.Any]] = {
+            "vad": load_silero_vad,
+            "gender": load_gender_model,
+        }
+
+    def get(self, name: str):
+        if name in self._models:
+            return self._models[name]
+
+        with self._lock:
+            if name not in self._models:
+                logging.info(f"Loading {name} model in pid={os.getpid()}")
+                try:
+                    self._models[name] = self._loaders[name]()
+                except Exception as exc:
+                    logging.error(f"Failed to load {name} model: {exc}")
+                    raise
+
+            return self._models[name]
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    @property
+    def vad(self):
+        """(model, utils) tuple returned by silero's hub entrypoint"""
+        return self.get("vad")
+
+    @property
+    def gender(self):
+        return self.get("gender")
+
+
+registry = ModelRegistry()
@@ -0,0 +1,196 @@
+"""
+Stage level decomposition of `api_processing` into a celery canvas:
+
+    stt -> chord(audio_ml, llm_general, llm_checklist, crm) -> merge
+
+Every stage has its own queue (see `task_routes`), so each can be scaled with
+its own worker concurrency. Independent branches run in parallel, end-to-end
+latency is the slowest branch instead of the sum of all of them.
+"""
+
+import os
+import logging
+import contextlib
+import typing as t
+
+from decouple import config
+from celery import chain, chord, group
+from celery.result import AsyncResult
+
+from workers import stt
+from workers.data import upsert_data
+from workers.common import celery, PredictTask
+from workers.api import (
+    api_processing,
+    transcribe,
+    lookup_crm,
+    analyze_general,
+    analyze_checklist,
+    cache_audio_info,
+    open_audio,
+    with_cached_transcript,
+    ensure_local_file,
+    get_cached_audio_info,
+    calculate_conversation_metrics,
+)
+
+# monolithic | canvas
+PIPELINE_MODE: str = config("PIPELINE_MODE", default="monolithic").lower()
+# hand transcription over to the `workers.stt` scheduler instead of waiting for it
+STT_SCHEDULER: bool = config("STT_SCHEDULER", cast=bool, default=False)
+
+
+def get_file_path(task: dict) -> str:
+    return os.path.join("uploads", task["audio_record"]["storage_id"])
+
+
+def get_offsets(task: dict) -> list[dict]:
+    return task["audio_record"]["payload"]["result"]["offsets"]
+
+
+@contextlib.contextmanager
+def local_audio(task: dict) -> t.Iterator[str]:
+    """
+    Path of the task's audio on this worker, a copy downloaded for the stage is
+    deleted once it is done. Stages may run on any host, nothing is left behind.
+    """
+    file_path = get_file_path(task)
+    downloaded = not os.path.exists(file_path)
+    storage_id = task["audio_record"]["storage_id"]
+    ensure_local_file(file_path, task["folder_name"], storage_id)
+
+    try:
+        yield file_path
+    finally:
+        if downloaded and os.path.exists(file_path):
+            os.remove(file_path)
+
+
+@celery.task(name="pipeline.stt", bind=True)
+def stt_stage(self, task: dict) -> dict:
+    record = with_cached_transcript(
+        task["audio_record"], get_file_path(task), task["folder_name"]
+    )
+    if not record.get("payload") and STT_SCHEDULER:
+        # upload is streamed, from the bucket if this worker has no local copy
+        with open_audio(
+            get_file_path(task), task["folder_name"], record["storage_id"]
+        ) as file:
+            stt.park(self.request, task, file)
+        # rest of the pipeline is resumed by the scheduler, slot is free now
+        return task
+
+    if record.get("payload"):
+        return {**task, "audio_record": record}
+
+    with local_audio(task) as file_path:
+        payload = transcribe(record, file_path)
+    return {**task, "audio_record": {**record, "payload": payload}}
+
+
+@celery.task(base=PredictTask, name="pipeline.audio_ml", bind=True)
+def audio_ml_stage(self: PredictTask, task: dict) -> dict:
+    record = task["audio_record"]
+    audio_info = get_cached_audio_info(record)
+
+    if audio_info is None:
+        with local_audio(task) as file_path:
+            audio_info = self.classify_speaker_gender(
+                file_path, record["title"], duration=record["duration"] / 1000
+            )
+        cache_audio_info(record, audio_info)
+
+    return {"customer_gender": audio_info["result"]["gender"]}
+
+
+@celery.task(name="pipeline.llm_general")
+def llm_general_stage(task: dict) -> dict:
+    record = task["audio_record"]
+    json_data = analyze_general(record, get_offsets(task))
+    json_data.update(
+        calculate_conversation_metrics(record["payload"], get_file_path(task))
+    )
+    return {"general_response": json_data}
+
+
+@celery.task(name="pipeline.llm_checklist")
+def llm_checklist_stage(task: dict) -> dict:
+    checklist_response = analyze_checklist(
+        task["audio_record"], get_offsets(task), task["checklist_id"]
+    )
+    return {"checklist_response": checklist_response}
+
+
+@celery.task(name="pipeline.crm")
+def crm_stage(task: dict) -> dict:
+    return {
+        "bitrix_result": lookup_crm(
+            task["audio_record"], task.get("client_phone_number")
+        )
+    }
+
+
+# chord headers need their results stored, merge output only goes to the callback
+@celery.task(name="pipeline.merge", ignore_result=True)
+def merge_stage(results: list[dict]) -> dict:
+    """Joins chord branches into the same shape `api_processing` returns"""
+    merged: dict[str, t.Any] = {}
+    for result in results:
+        merged.update(result)
+
+    general_response = merged.get("general_response", {})
+    if general_response and "customer_gender" in merged:
+        general_response["customer_gender"] = merged["customer_gender"]
+
+    return {
+        "general_response": general_response,
+        "checklist_response": merged.get("checklist_response", {}),
+        "bitrix_result": merged.get("bitrix_result"),
+    }
+
+
+def build_canvas(task: dict):
+    branches = [crm_stage.s()]
+
+    if task.get("general"):
+        branches += [audio_ml_stage.s(), llm_general_stage.s()]
+
+    if task.get("checklist_id"):
+        branches.append(llm_checklist_stage.s())
+
+    # audio is fetched by the stages that need it, on their own hosts
+    return chain(
+        stt_stage.s(task),
+        chord(group(branches), merge_stage.s()),
+    )
+
+
+def enqueue_processing(task: dict, callback: dict, task_id: str) -> AsyncResult:
+    """
+    Routes `task` through the monolithic `api_processing` task or the staged
+    canvas (PIPELINE_MODE), `upsert_data` gets the final result either way.
+    """
+    on_success = upsert_data.s(task={**callback, "is_success": True}).set(
+        queue="data"
+    )
+    on_error = upsert_data.s(task={**callback, "is_success": False}).set(
+        queue="data"
+    )
+
+    if PIPELINE_MODE != "canvas":
+        return api_processing.apply_async(
+            kwargs={"task": task},
+            link=on_success,
+            link_error=on_error,
+            queue="api",
+            task_id=task_id,
+        )
+
+    logging.info(f"Routing {task_id=} through the staged pipeline")
+    canvas = build_canvas(task)
+    # merge task gets the public task id, its output goes to upsert_data as is
+    merge = canvas.tasks[-1].body
+    merge.set(task_id=task_id)
+    merge.link(on_success)
+    canvas.link_error(on_error)
+    return canvas.apply_async()
@@ -0,0 +1,223 @@
+"""
+Non blocking transcription for the staged pipeline.
+
+`pipeline.stt` submits the file to MohirAI and parks the rest of the canvas in
+redis instead of sleeping on a worker slot. A single scheduler process
+(`python -m workers.stt`) polls every outstanding job with adaptive backoff and
+resumes the pipeline as soon as its transcript is ready.
+"""
+
+import json
+import time
+import asyncio
+import logging
+import typing as t
+
+import httpx
+from redis import Redis
+from celery import signature
+from decouple import config
+
+from utils.encoder import Encoder
+from utils.redis_utils import redis_client
+from utils.mohirai import (
+    AsyncMohirAI,
+    MohirAIError,
+    calculate_sleep_time,
+    next_poll_interval,
+)
+from workers.common import celery
+from workers.api import save_transcription
+
+# jobs polled at the same time by one scheduler
+STT_SCHEDULER_CONCURRENCY: int = config(
+    "STT_SCHEDULER_CONCURRENCY", cast=int, default=64
+)
+STT_SCHEDULER_TICK: float = config("STT_SCHEDULER_TICK", cast=float, default=1.0)
+# job is failed if MohirAI did not finish it within this many seconds
+STT_JOB_TIMEOUT: int = config("STT_JOB_TIMEOUT", cast=int, default=3 * 60 * 60)
+# claimed job becomes due again after this, if its scheduler died meanwhile
+STT_CLAIM_LEASE: int = config("STT_CLAIM_LEASE", cast=int, default=300)
+
+
+class PendingJobs:
+    """
+    Outstanding MohirAI jobs, shared by all workers:
+      - `{prefix}:jobs` hash, job id -> job state (JSON)
+      - `{prefix}:schedule` zset, job id -> next poll timestamp
+    """
+
+    def __init__(self, prefix: str = "stt", client: t.Optional[Redis] = None):
+        self.client = client or redis_client
+        self.jobs_key = f"{prefix}:jobs"
+        self.schedule_key = f"{prefix}:schedule"
+
+    def add(self, job_id: str, job: dict, next_poll: float) -> None:
+        with self.client.pipeline() as pipeline:
+            pipeline.hset(self.jobs_key, job_id, json.dumps(job, cls=Encoder))
+            pipeline.zadd(self.schedule_key, {job_id: next_poll})
+            pipeline.execute()
+
+    reschedule = add
+
+    def update(self, job_id: str, job: dict) -> None:
+        """Stores the job state, leaving its schedule (or claim) as it is"""
+        self.client.hset(self.jobs_key, job_id, json.dumps(job, cls=Encoder))
+
+    def due(self, now: float, limit: int) -> list[str]:
+        job_ids = self.client.zrangebyscore(
+            self.schedule_key, "-inf", now, start=0, num=limit
+        )
+        return [
+            job_id.decode() if isinstance(job_id, bytes) else job_id
+            for job_id in job_ids
+        ]
+
+    def claim(self, job_id: str, now: float) -> dict | None:
+        """Only one of concurrently running schedulers gets the job"""
+        if not self.client.zrem(self.schedule_key, job_id):
+            return None
+
+        self.client.zadd(self.schedule_key, {job_id: now + STT_CLAIM_LEASE})
+        value = self.client.hget(self.jobs_key, job_id)
+        if value is None:
+            self.client.zrem(self.schedule_key, job_id)
+            return None
+
+        return json.loads(value)
+
+    def remove(self, job_id: str) -> None:
+        with self.client.pipeline() as pipeline:
+            pipeline.hdel(self.jobs_key, job_id)
+            pipeline.zrem(self.schedule_key, job_id)
+            pipeline.execute()
+
+    def size(self) -> int:
+        return self.client.zcard(self.schedule_key)
+
+
+pending_jobs = PendingJobs()
+
+
+def park(request, task: dict, source: str | t.BinaryIO) -> str:
+    """
+    Submits `source` (path or file object) and stores the rest of the chain of the currently
+    running celery task (`request`), which then ends without calling it.
+    """
+    record = task["audio_record"]
+    job_id = asyncio.run(submit(source))
+    interval = calculate_sleep_time(record["duration"] / 60000)
+    now = time.time()
+
+    pending_jobs.add(
+        job_id,
+        {
+            "task": task,
+            "celery_task_id": request.id,
+            "chain": request.chain or [],
+            "errbacks": request.errbacks or [],
+            "submitted_at": now,
+            "interval": interval,
+        },
+        next_poll=now + interval,
+    )
+    # celery calls the next task of the chain only if it is still there
+    request.chain = None
+
+    logging.info(f"Parked {request.id=} until MohirAI {job_id=} is done")
+    return job_id
+
+
+async def submit(source: str | t.BinaryIO) -> str:
+    async with AsyncMohirAI() as client:
+        return await client.submit(source)
+
+
+def resume(job_id: str, job: dict, payload: dict) -> None:
+    task = job["task"]
+    record = task["audio_record"]
+
+    # a failed enqueue leaves the job to be resumed again, bill it only once
+    if not job.get("billed"):
+        save_transcription(record, payload)
+        job["billed"] = True
+        pending_jobs.update(job_id, job)
+
+    chain = list(job["chain"])
+    if not chain:
+        return
+
+    # same as celery's own tracer does when a chain member succeeds
+    next_task = signature(chain.pop(), app=celery)
+    next_task.apply_async(
+        ({**task, "audio_record": {**record, "payload": payload}},),
+        chain=chain or None,
+        parent_id=job["celery_task_id"],
+    )
+
+
+def fail(job: dict, exc: Exception) -> None:
+    logging.error(f"Transcription of {job['celery_task_id']=} failed: {exc}")
+    for errback in job["errbacks"]:
+        signature(errback, app=celery).apply_async((job["celery_task_id"],))
+
+
+async def poll(client: AsyncMohirAI, job_id: str, job: dict) -> None:
+    try:
+        payload = await client.fetch(job_id)
+    except MohirAIError as exc:
+        pending_jobs.remove(job_id)
+        await asyncio.to_thread(fail, job, exc)
+        return
+    except httpx.HTTPError as exc:
+        # network hiccup, not the job's fault, check it again later
+        logging.warning(f"Polling MohirAI {job_id=} failed: {exc}")
+        payload = None
+
+    if payload is not None:
+        await asyncio.to_thread(resume, job_id, job, payload)
+        pending_jobs.remove(job_id)
+        return
+
+    now = time.time()
+    if now - job["submitted_at"] > STT_JOB_TIMEOUT:
+        pending_jobs.remove(job_id)
+        await asyncio.to_thread(
+            fail, job, TimeoutError(f"MohirAI {job_id=} timed out")
+        )
+        return
+
+    job["interval"] = next_poll_interval(job["interval"])
+    pending_jobs.reschedule(job_id, job, next_poll=now + job["interval"])
+
+
+async def run_scheduler() -> None:
+    logging.info(f"STT scheduler started, {pending_jobs.size()} jobs pending")
+    in_flight: set[asyncio.Task] = set()
+
+    def on_polled(polling: asyncio.Task):
+        in_flight.discard(polling)
+        if not polling.cancelled() and polling.exception():
+            # job stays claimed, it is picked up again once the lease expires
+            logging.error(f"STT job polling failed: {polling.exception()}")
+
+    async with AsyncMohirAI() as client:
+        while True:
+            now = time.time()
+            free = STT_SCHEDULER_CONCURRENCY - len(in_flight)
+
+            for job_id in pending_jobs.due(now, free) if free > 0 else []:
+                job = pending_jobs.claim(job_id, now)
+                if job is None:
+                    continue
+
+                polling = asyncio.create_task(poll(client, job_id, job))
+                in_flight.add(polling)
+                polling.add_done_callback(on_polled)
+
+            await asyncio.sleep(STT_SCHEDULER_TICK)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_scheduler())